@@ -0,0 +1,71 @@
+"""Two-pass pandas deduplication vs the hashed RowDeduplicator.
+
+    python ml/benchmarks/bench_dedup.py --n_rows 5000000 --n_chunks 10
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "preprocessing"))
+
+import numpy as np
+from synthetic_data import generate_trips
+from dedup import RowDeduplicator
+from load_data import KEPT_COLUMNS, downcast_data
+
+
+def pandas_two_pass(data):
+    n_duplicates = data.duplicated().sum()
+    return data.drop_duplicates(), n_duplicates
+
+
+def hashed(data):
+    return RowDeduplicator().drop_duplicates(data)
+
+
+def hashed_chunked(data, n_chunks):
+    deduplicator = RowDeduplicator()
+    kept, n_duplicates = [], 0
+    for chunk in np.array_split(np.arange(len(data)), n_chunks):
+        chunk_kept, chunk_duplicates = deduplicator.drop_duplicates(data.iloc[chunk])
+        kept.append(len(chunk_kept))
+        n_duplicates += chunk_duplicates
+    return sum(kept), n_duplicates
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, round(time.perf_counter() - start, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_rows", type=int, default=5_000_000)
+    parser.add_argument("--n_chunks", type=int, default=10)
+    parser.add_argument("--duplicate_rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    data = downcast_data(generate_trips(args.n_rows, duplicate_rate=args.duplicate_rate)[KEPT_COLUMNS])
+
+    (pandas_kept, pandas_duplicates), pandas_seconds = timed(pandas_two_pass, data)
+    (hashed_kept, hashed_duplicates), hashed_seconds = timed(hashed, data)
+    (chunked_rows, chunked_duplicates), chunked_seconds = timed(hashed_chunked, data, args.n_chunks)
+
+    assert pandas_kept.index.equals(hashed_kept.index)
+    assert pandas_duplicates == hashed_duplicates == chunked_duplicates
+
+    print(json.dumps({
+        "rows": args.n_rows,
+        "duplicates": int(pandas_duplicates),
+        "pandas_two_pass_seconds": pandas_seconds,
+        "hashed_seconds": hashed_seconds,
+        f"hashed_{args.n_chunks}_chunks_seconds": chunked_seconds,
+        "seen_set_bytes": 8 * chunked_rows,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Per-request overhead of drift monitoring in predict_fn, and the scores it reports.
+
+Trains a forest on synthetic trips, profiles its training split and its
+predictions on it into the model dir as preprocessing and training would,
+then replays parsed requests through the model followed by the drift
+monitor update predict_fn makes, timing the two separately. Two more replays, of fresh trips and of trips with
+trip_distance doubled, check that drift shows up in the scores and only there.
+
+    python ml/benchmarks/bench_drift_monitor.py --n_requests 20000 --batch_sizes 1 10 100
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "inference"))
+
+import numpy as np
+import inference
+from bench_inference_server import build_model_dir, trip_features
+from common.data_profile import PROFILE_NAME, DataProfile, write_model_profile, write_profiles
+
+
+def replay(model, batches):
+    """Latency of each prediction, and microseconds per request spent in the drift monitor update."""
+    latencies = np.empty(len(batches))
+    drift_seconds = 0.0
+    for i, X in enumerate(batches):
+        start = time.perf_counter()
+        prediction = model.predict(X)
+        predicted = time.perf_counter()
+        inference._drift.update(X, prediction)
+        latencies[i] = predicted - start
+        drift_seconds += time.perf_counter() - predicted
+    drift_us = drift_seconds / len(batches) * 1e6
+    return {
+        "predict_p50_us": round(float(np.percentile(latencies, 50)) * 1e6, 1),
+        "predict_p99_us": round(float(np.percentile(latencies, 99)) * 1e6, 1),
+        "drift_us_per_request": round(drift_us, 2),
+        "drift_share": round(drift_us / (float(np.mean(latencies)) * 1e6), 4),
+    }
+
+
+def request_batches(X: np.ndarray, n_requests, batch_size):
+    return [X[(i * batch_size) % (len(X) - batch_size):][:batch_size] for i in range(n_requests)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_requests", type=int, default=20_000)
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--n_estimators", type=int, default=200)
+    parser.add_argument("--max_depth", type=int, default=10)
+    parser.add_argument("--drift_bins", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        build_model_dir(model_dir, args.n_estimators, args.max_depth, with_arrays=True)
+        profile_path = os.path.join(model_dir, PROFILE_NAME)
+        model = inference.load_model(model_dir)
+        X_train, y_train = trip_features(200_000, seed=0)
+        # As save_models does: the reference for predictions is the model's own on the training rows.
+        train_predictions = model.predict(X_train[model.feature_names].to_numpy(dtype=np.float32))
+        write_profiles({"train": DataProfile().update(X_train.assign(fare_amount=y_train))}, profile_path)
+        write_model_profile(profile_path, train_predictions, profile_path)
+        model = inference.model_fn(model_dir)
+
+        X_live, _ = trip_features(200_000, seed=1)
+        X_live = X_live[model.feature_names].to_numpy(dtype=np.float32)
+        X_shifted = X_live.copy()
+        X_shifted[:, model.feature_names.index("trip_distance")] *= 2
+
+        results = {}
+        for batch_size in args.batch_sizes:
+            inference.configure_drift(model, profile_path, args.drift_bins)
+            results[f"batch_{batch_size}"] = replay(model, request_batches(X_live, args.n_requests, batch_size))
+
+        scores = {}
+        for name, X in (("same_distribution", X_live), ("trip_distance_doubled", X_shifted)):
+            inference.configure_drift(model, profile_path, args.drift_bins)
+            replay(model, request_batches(X, len(X) // 100, 100))
+            drift = inference.drift_metrics()
+            scores[name] = {column: {k: round(v, 4) for k, v in score.items()}
+                            for column, score in drift["columns"].items()}
+
+    print(json.dumps({"requests": args.n_requests, "latency": results, "scores": scores}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Time every stage from raw monthly parquet files to evaluation on synthetic trips.
+
+Writes a JSON report with seconds, rows/s and peak RSS per stage plus
+artifact sizes, so runs can be compared across commits:
+
+    python ml/benchmarks/bench_end_to_end.py --n_rows 1000000 --n_months 2 --output end_to_end.json
+
+Peak RSS is per stage where the kernel allows resetting the high-water mark
+(/proc/self/clear_refs); otherwise it is the process peak so far.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, "..", "src")
+for path in (SRC_DIR, *(os.path.join(SRC_DIR, step) for step in ("preprocessing", "training", "evaluation",
+                                                                   "inference")),
+             os.path.join(BENCH_DIR, "..", "pipelines")):
+    sys.path.append(path)
+
+import joblib
+import numpy as np
+import pandas as pd
+from synthetic_data import write_trip_months
+import load_data as preprocessing
+import train_model as training
+import evaluate as evaluation
+import inference
+from dedup import RowDeduplicator
+from pipeline_config import SPLIT_KEY_COLUMNS
+from common.dataset_io import iter_dataset_batches, read_dataset, write_dataset
+from common.forest_arrays import forest_to_arrays, save_forest_arrays
+from common.metrics import RegressionMetrics
+
+TARGET = "fare_amount"
+
+
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def path_bytes(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+class Stages:
+    def __init__(self):
+        self.results = {}
+
+    @contextmanager
+    def stage(self, name, rows):
+        """Time a stage; `rows` is what throughput is reported for, the yielded dict takes extra fields."""
+        reset_peak_rss()
+        extra = {}
+        start = time.perf_counter()
+        yield extra
+        seconds = time.perf_counter() - start
+        self.results[name] = {
+            "seconds": round(seconds, 4),
+            "rows": rows,
+            "rows_per_second": round(rows / seconds, 1) if seconds > 0 else None,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            **extra,
+        }
+        print(f"{name:>15}: {seconds:8.3f}s {self.results[name]['peak_rss_mb']:8.1f} MB", flush=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_rows", type=int, default=1_000_000, help="Rows per monthly file")
+    parser.add_argument("--n_months", type=int, default=2)
+    parser.add_argument("--n_estimators", type=int, default=100)
+    parser.add_argument("--max_depth", type=int, default=10)
+    parser.add_argument("--model_type", choices=training.MODEL_TYPES, default="forest")
+    parser.add_argument("--single_predictions", type=int, default=1000)
+    parser.add_argument("--batch_rows", type=int, default=1_000_000, help="Evaluation chunk size")
+    parser.add_argument("--output", default="end_to_end.json")
+    args = parser.parse_args()
+
+    stages = Stages()
+    artifacts = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = os.path.join(tmp_dir, "raw")
+        total_rows = args.n_rows * args.n_months
+        with stages.stage("generate", total_rows):
+            input_paths = write_trip_months(raw_dir, args.n_rows, args.n_months)
+        artifacts["raw_bytes"] = path_bytes(raw_dir)
+
+        with stages.stage("load", total_rows) as extra:
+            data = pd.concat([preprocessing.load_data(path, columns=preprocessing.KEPT_COLUMNS,
+                                                      filters=preprocessing.ROW_FILTERS)
+                              for path in input_paths], ignore_index=True)
+            extra["rows_kept"] = len(data)
+
+        with stages.stage("process", len(data)):
+            data = preprocessing.prepare_features(data)
+
+        with stages.stage("dedupe", len(data)) as extra:
+            data, extra["duplicates"] = RowDeduplicator().drop_duplicates(data)
+
+        with stages.stage("split", len(data)):
+            train_df, test_df = preprocessing.hash_split_data(data, 0.2, SPLIT_KEY_COLUMNS)
+        del data
+
+        train_path = os.path.join(tmp_dir, "train.feather")
+        test_path = os.path.join(tmp_dir, "test.feather")
+        with stages.stage("save", len(train_df) + len(test_df)):
+            write_dataset(train_df, train_path, compression="uncompressed")
+            write_dataset(test_df, test_path, compression="uncompressed")
+        artifacts["train_bytes"] = path_bytes(train_path)
+        artifacts["test_bytes"] = path_bytes(test_path)
+        del train_df, test_df
+
+        train_df = read_dataset(train_path, memory_map=True)
+        with stages.stage("train", len(train_df)):
+            X_train = train_df.drop(columns=TARGET)
+            model = training.build_model(args.model_type, X_train, args.n_estimators, args.max_depth, 58)
+            model.fit(X_train, train_df[TARGET])
+        del train_df, X_train
+
+        model_dir = os.path.join(tmp_dir, "model")
+        os.makedirs(model_dir)
+        with stages.stage("serialize", 1):
+            joblib.dump(model, os.path.join(model_dir, "model.pkl"))
+            if args.model_type == "forest":
+                save_forest_arrays(forest_to_arrays(model), os.path.join(model_dir, "forest"))
+        artifacts["model_pickle_bytes"] = path_bytes(os.path.join(model_dir, "model.pkl"))
+        if args.model_type == "forest":
+            artifacts["forest_arrays_bytes"] = path_bytes(os.path.join(model_dir, "forest"))
+        del model
+
+        with stages.stage("load_model", 1):
+            served = inference.load_model(model_dir)
+
+        test_df = read_dataset(test_path, memory_map=True)
+        X_test = np.ascontiguousarray(test_df.drop(columns=TARGET).to_numpy(dtype=np.float32))
+        with stages.stage("batch_predict", len(X_test)):
+            served.predict(X_test)
+
+        n_single = min(args.single_predictions, len(X_test))
+        bodies = [",".join(map(repr, row)) for row in X_test[:n_single].astype(np.float64).tolist()]
+        latencies = np.empty(n_single)
+        with stages.stage("single_predict", n_single) as extra:
+            for i, body in enumerate(bodies):
+                start = time.perf_counter()
+                inference.predict_fn(inference.input_fn(body, "text/csv", served), served)
+                latencies[i] = time.perf_counter() - start
+            extra["p50_ms"] = round(float(np.percentile(latencies, 50)) * 1000, 4)
+            extra["p99_ms"] = round(float(np.percentile(latencies, 99)) * 1000, 4)
+
+        model = served.predictor
+        with stages.stage("evaluate", len(test_df)) as extra:
+            metrics = RegressionMetrics()
+            for chunk in iter_dataset_batches(test_path, args.batch_rows):
+                metrics.merge(evaluation.evaluate(model, chunk, TARGET)[0])
+            extra["test_score"] = metrics.result()
+
+    report = {
+        "commit": git_commit(),
+        "config": vars(args),
+        "stages": stages.results,
+        "artifacts": artifacts,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
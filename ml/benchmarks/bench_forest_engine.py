@@ -0,0 +1,66 @@
+"""Latency of sklearn's forest predict vs ForestEngine at several batch sizes.
+
+    python ml/benchmarks/bench_forest_engine.py --n_rows 500000 --batch_sizes 1 100 100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "preprocessing"))
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from synthetic_data import generate_trips
+from load_data import KEPT_COLUMNS, ROW_FILTERS, apply_row_filters, process_data
+from common.dataset_io import cast_frame
+from common.forest_engine import ForestEngine
+
+
+def median_seconds(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_rows", type=int, default=500_000)
+    parser.add_argument("--n_estimators", type=int, default=200)
+    parser.add_argument("--max_depth", type=int, default=10)
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 100, 100_000])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    data = cast_frame(process_data(apply_row_filters(generate_trips(args.n_rows)[KEPT_COLUMNS], ROW_FILTERS)))
+    X = data.drop(columns="fare_amount")
+    model = RandomForestRegressor(n_estimators=args.n_estimators, max_depth=args.max_depth,
+                                  random_state=58, n_jobs=-1)
+    model.fit(X, data["fare_amount"])
+    model.set_params(n_jobs=1)
+    engine = ForestEngine.from_model(model)
+
+    results = []
+    for batch_size in args.batch_sizes:
+        batch = X.iloc[:batch_size]
+        matrix = engine.to_matrix(batch)
+        assert np.array_equal(engine.predict(batch), model.predict(batch)), "predictions differ"
+        repeats = args.repeats if batch_size < 10_000 else max(1, args.repeats // 10)
+        sklearn_seconds = median_seconds(lambda: model.predict(batch), repeats)
+        engine_seconds = median_seconds(lambda: engine.predict(matrix), repeats)
+        results.append({
+            "batch_size": batch_size,
+            "sklearn_ms": round(sklearn_seconds * 1000, 3),
+            "engine_ms": round(engine_seconds * 1000, 3),
+            "speedup": round(sklearn_seconds / engine_seconds, 2),
+        })
+    print(json.dumps({"n_trees": args.n_estimators, "max_depth": args.max_depth, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""p50/p99 latency and throughput of the local inference server, started in a subprocess.
+
+    python ml/benchmarks/bench_inference_server.py --n_requests 2000 --concurrency 4 --batch_size 1
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "preprocessing"))
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from synthetic_data import generate_trips
+from load_data import KEPT_COLUMNS, ROW_FILTERS, apply_row_filters, process_data
+from common.dataset_io import cast_frame
+from common.forest_arrays import forest_to_arrays, save_forest_arrays
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "inference", "local_server.py")
+
+
+def trip_features(n_rows, seed):
+    data = cast_frame(process_data(apply_row_filters(generate_trips(n_rows, seed=seed)[KEPT_COLUMNS], ROW_FILTERS)))
+    return data.drop(columns="fare_amount"), data["fare_amount"]
+
+
+def build_model_dir(model_dir, n_estimators, max_depth, with_arrays):
+    X, y = trip_features(200_000, seed=0)
+    model = RandomForestRegressor(n_estimators=n_estimators, max_depth=max_depth, random_state=58, n_jobs=-1)
+    model.fit(X, y)
+    joblib.dump(model, os.path.join(model_dir, "model.pkl"))
+    if with_arrays:
+        save_forest_arrays(forest_to_arrays(model), os.path.join(model_dir, "forest"))
+
+
+def csv_requests(n_requests, batch_size):
+    X, _ = trip_features(n_requests * batch_size + 1000, seed=1)
+    rows = [",".join(map(repr, row)) for row in X.to_numpy(dtype=np.float64).tolist()]
+    return [("\n".join(rows[i * batch_size:(i + 1) * batch_size]), "text/csv") for i in range(n_requests)]
+
+
+def json_requests(n_requests):
+    """One single-trip JSON record per request, the shape of a recorded requests.jsonl replay file."""
+    X, _ = trip_features(n_requests + 1000, seed=1)
+    return [json.dumps(record) for record in X.iloc[:n_requests].to_dict(orient="records")]
+
+
+def start_server(model_dir, port, server_args=()):
+    server = subprocess.Popen([sys.executable, SERVER, "--model_dir", model_dir, "--port", str(port), *server_args])
+    for _ in range(600):
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/ping")
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("Inference server did not start")
+
+
+def replay(port, requests, concurrency):
+    """Send the requests from `concurrency` keep-alive connections; return per-request latencies and wall time."""
+    latencies = [None] * len(requests)
+    next_request = iter(range(len(requests)))
+    lock = threading.Lock()
+    errors = []
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        while not errors:
+            with lock:
+                index = next(next_request, None)
+            if index is None:
+                return
+            body, content_type = requests[index]
+            start = time.perf_counter()
+            connection.request("POST", "/invocations", body=body,
+                               headers={"Content-Type": content_type, "Accept": "text/csv"})
+            response = connection.getresponse()
+            message = response.read()
+            latencies[index] = time.perf_counter() - start
+            if response.status != 200:
+                errors.append(f"Request {index} failed with {response.status}: {message[:200]!r}")
+
+    start = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    if errors:
+        raise RuntimeError(errors[0])
+    return np.array(latencies), time.perf_counter() - start
+
+
+def latency_report(latencies, seconds, rows):
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+        "requests_per_second": round(len(latencies) / seconds, 1),
+        "rows_per_second": round(rows / seconds, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir", default=None, help="Existing model dir; a forest is trained when omitted")
+    parser.add_argument("--n_estimators", type=int, default=200)
+    parser.add_argument("--max_depth", type=int, default=10)
+    parser.add_argument("--predictor", choices=["arrays", "sklearn"], default="arrays")
+    parser.add_argument("--n_requests", type=int, default=2000)
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_dir = args.model_dir
+        if model_dir is None:
+            model_dir = tmp_dir
+            build_model_dir(model_dir, args.n_estimators, args.max_depth, args.predictor == "arrays")
+        requests = csv_requests(args.n_requests, args.batch_size)
+        server = start_server(model_dir, args.port)
+        try:
+            replay(args.port, requests[:50], args.concurrency)
+            latencies, seconds = replay(args.port, requests, args.concurrency)
+        finally:
+            server.terminate()
+            server.wait()
+
+    report = latency_report(latencies, seconds, args.n_requests * args.batch_size)
+    print(json.dumps(dict(predictor=args.predictor, batch_size=args.batch_size,
+                          concurrency=args.concurrency, **report), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Size and load time of the joblib forest pickle vs the flat tree arrays.
+
+    python ml/benchmarks/bench_model_artifact.py --n_rows 500000 --n_estimators 200
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "preprocessing"))
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from synthetic_data import generate_trips
+from load_data import KEPT_COLUMNS, ROW_FILTERS, apply_row_filters, process_data
+from common.forest_arrays import forest_to_arrays, load_forest_arrays, save_forest_arrays
+
+
+def directory_bytes(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def best_of(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return round(min(timings), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_rows", type=int, default=500_000)
+    parser.add_argument("--n_estimators", type=int, default=200)
+    parser.add_argument("--max_depth", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    data = process_data(apply_row_filters(generate_trips(args.n_rows)[KEPT_COLUMNS], ROW_FILTERS))
+    model = RandomForestRegressor(n_estimators=args.n_estimators, max_depth=args.max_depth,
+                                  random_state=58, n_jobs=-1)
+    model.fit(data.drop(columns="fare_amount"), data["fare_amount"])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pickle_path = os.path.join(tmp_dir, "model.pkl")
+        arrays_dir = os.path.join(tmp_dir, "forest")
+        joblib.dump(model, pickle_path)
+        save_forest_arrays(forest_to_arrays(model), arrays_dir)
+
+        forest = load_forest_arrays(arrays_dir)
+        assert forest.n_trees == args.n_estimators
+        assert np.array_equal(forest.value[forest.roots], [e.tree_.value[0, 0, 0] for e in model.estimators_])
+
+        print(json.dumps({
+            "n_trees": args.n_estimators,
+            "n_nodes": forest.manifest["n_nodes"],
+            "joblib_bytes": os.path.getsize(pickle_path),
+            "arrays_bytes": directory_bytes(arrays_dir),
+            "joblib_load_seconds": best_of(lambda: joblib.load(pickle_path), args.repeats),
+            "arrays_mmap_load_seconds": best_of(lambda: load_forest_arrays(arrays_dir), args.repeats),
+            "arrays_read_load_seconds": best_of(lambda: load_forest_arrays(arrays_dir, mmap=False), args.repeats),
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
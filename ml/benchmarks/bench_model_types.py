@@ -0,0 +1,80 @@
+"""Random forest vs histogram gradient boosting on the same synthetic split.
+
+Reports fit time, pickled model size, single-row and batch prediction
+latency and test RMSE for each --model_type of train_model.py:
+
+    python ml/benchmarks/bench_model_types.py --n_rows 1000000
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "preprocessing"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "training"))
+
+import joblib
+import numpy as np
+from synthetic_data import generate_trips
+from load_data import KEPT_COLUMNS, apply_row_filters, ROW_FILTERS, process_data, hash_split_data
+from train_model import MODEL_TYPES, build_model
+
+TARGET = "fare_amount"
+
+
+def benchmark(model_type, train_data, test_data, n_estimators, max_depth, single_row_calls):
+    X_train, y_train = train_data.drop(columns=TARGET), train_data[TARGET]
+    X_test, y_test = test_data.drop(columns=TARGET), test_data[TARGET]
+
+    model = build_model(model_type, X_train, n_estimators, max_depth, random_state=58)
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+
+    start = time.perf_counter()
+    predictions = model.predict(X_test)
+    batch_seconds = time.perf_counter() - start
+
+    single_row_seconds = []
+    for row in range(single_row_calls):
+        start = time.perf_counter()
+        model.predict(X_test.iloc[row:row + 1])
+        single_row_seconds.append(time.perf_counter() - start)
+
+    return {
+        "model_type": model_type,
+        "fit_seconds": round(fit_seconds, 3),
+        "model_bytes": buffer.tell(),
+        "batch_predict_seconds": round(batch_seconds, 3),
+        "batch_rows": len(X_test),
+        "single_row_p50_ms": round(1000 * float(np.percentile(single_row_seconds, 50)), 3),
+        "single_row_p99_ms": round(1000 * float(np.percentile(single_row_seconds, 99)), 3),
+        "test_rmse": round(float(np.sqrt(np.mean((predictions - y_test.to_numpy()) ** 2))), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_rows", type=int, default=1_000_000)
+    parser.add_argument("--n_estimators", type=int, default=200)
+    parser.add_argument("--max_depth", type=int, default=10)
+    parser.add_argument("--single_row_calls", type=int, default=200)
+    parser.add_argument("--model_types", nargs="+", default=list(MODEL_TYPES))
+    args = parser.parse_args()
+
+    trips = apply_row_filters(generate_trips(args.n_rows)[KEPT_COLUMNS], ROW_FILTERS)
+    train_data, test_data = hash_split_data(process_data(trips), test_size=0.2)
+
+    results = [benchmark(model_type, train_data, test_data, args.n_estimators, args.max_depth,
+                         args.single_row_calls)
+               for model_type in args.model_types]
+    print(json.dumps({"train_rows": len(train_data), "test_rows": len(test_data), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Read-then-drop vs projected/pushed-down parquet reads in load_data.
+
+Each variant runs in its own subprocess so peak RSS is measured in
+isolation. Example:
+
+    python ml/benchmarks/bench_parquet_read.py --n_rows 5000000
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "preprocessing"))
+
+from synthetic_data import write_trip_parquet
+# Imported here, not in the variants, so pandas/pyarrow/sklearn start-up is not timed as part of a read.
+from load_data import (COLUMNS_TO_REMOVE, KEPT_COLUMNS, ROW_FILTERS, apply_row_filters, iter_parquet_batches,
+                       load_data)
+
+
+class CountingFile(io.RawIOBase):
+    """Read-only file wrapper that counts the bytes handed to the reader."""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def readinto(self, buffer):
+        n = self._file.readinto(buffer)
+        self.bytes_read += n or 0
+        return n
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def read_then_drop(input_path):
+    source = CountingFile(input_path)
+    data = load_data(source)
+    data = data.drop(columns=COLUMNS_TO_REMOVE)
+    data = apply_row_filters(data, ROW_FILTERS)
+    return len(data), source.bytes_read
+
+
+def pushdown(input_path):
+    source = CountingFile(input_path)
+    data = load_data(source, columns=KEPT_COLUMNS, filters=ROW_FILTERS)
+    return len(data), source.bytes_read
+
+
+def streaming_pushdown(input_path):
+    source = CountingFile(input_path)
+    rows = 0
+    for batch in iter_parquet_batches(source, 500_000, columns=KEPT_COLUMNS, filters=ROW_FILTERS):
+        rows += len(batch)
+    return rows, source.bytes_read
+
+
+VARIANTS = {
+    "read_then_drop": read_then_drop,
+    "pushdown": pushdown,
+    "streaming_pushdown": streaming_pushdown,
+}
+
+
+def run_variant(name, input_path):
+    start = time.perf_counter()
+    rows, bytes_read = VARIANTS[name](input_path)
+    return {
+        "variant": name,
+        "rows": rows,
+        "bytes_read": bytes_read,
+        "wall_seconds": round(time.perf_counter() - start, 3),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_path", default=None, help="Existing trip parquet; generated when omitted")
+    parser.add_argument("--n_rows", type=int, default=5_000_000)
+    parser.add_argument("--row_group_size", type=int, default=1_000_000)
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS))
+    parser.add_argument("--run_variant", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_variant:
+        print(json.dumps(run_variant(args.run_variant, args.input_path)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = args.input_path
+        if input_path is None:
+            input_path = write_trip_parquet(os.path.join(tmp_dir, "trips.parquet"), args.n_rows, args.row_group_size)
+
+        results = []
+        for name in args.variants:
+            completed = subprocess.run(
+                [sys.executable, __file__, "--run_variant", name, "--input_path", input_path],
+                check=True, capture_output=True, text=True,
+            )
+            results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+        file_bytes = os.path.getsize(input_path)
+
+    print(json.dumps({"file_bytes": file_bytes, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Per-request latency and CPU time of input_fn + predict_fn with and without the prediction cache.
+
+Replays a JSONL file with one JSON request body per line, or generates one in
+which trips are drawn from a pool with Zipf popularity, the way zone pairs and
+rounded distances repeat in real traffic.
+
+    python ml/benchmarks/bench_prediction_cache.py --n_requests 20000 --cache_size 50000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "inference"))
+
+import numpy as np
+import inference
+from bench_inference_server import build_model_dir, trip_features
+from bench_request_coalescing import load_requests
+
+
+def popular_trip_requests(n_requests, n_unique, zipf_a=1.3, seed=0):
+    X, _ = trip_features(n_unique + 1000, seed=1)
+    X = X.iloc[:n_unique].copy()
+    X["trip_distance"] = X["trip_distance"].round(1)
+    records = [json.dumps(record) for record in X.to_dict(orient="records")]
+    ranks = np.random.default_rng(seed).zipf(zipf_a, n_requests * 2)
+    ranks = ranks[ranks <= n_unique][:n_requests] - 1
+    return [records[rank] for rank in ranks]
+
+
+def replay(model, bodies):
+    latencies = np.empty(len(bodies))
+    cpu_start = time.process_time()
+    for i, body in enumerate(bodies):
+        start = time.perf_counter()
+        inference.predict_fn(inference.input_fn(body, "application/json", model), model)
+        latencies[i] = time.perf_counter() - start
+    cpu_seconds = time.process_time() - cpu_start
+    return {
+        "p50_us": round(float(np.percentile(latencies, 50)) * 1e6, 1),
+        "p99_us": round(float(np.percentile(latencies, 99)) * 1e6, 1),
+        "cpu_seconds": round(cpu_seconds, 3),
+        "cache": inference.cache_metrics(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", default=None, help="JSONL replay file, one JSON request body per line")
+    parser.add_argument("--n_requests", type=int, default=20_000)
+    parser.add_argument("--n_unique", type=int, default=20_000, help="Pool size of generated distinct trips")
+    parser.add_argument("--model_dir", default=None, help="Existing model dir; a forest is trained when omitted")
+    parser.add_argument("--n_estimators", type=int, default=200)
+    parser.add_argument("--max_depth", type=int, default=10)
+    parser.add_argument("--cache_size", type=int, default=50_000)
+    parser.add_argument("--cache_ttl", type=float, default=None)
+    parser.add_argument("--cache_quantize", default="trip_distance=0.1")
+    args = parser.parse_args()
+
+    bodies = load_requests(args.requests) if args.requests else popular_trip_requests(args.n_requests, args.n_unique)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_dir = args.model_dir
+        if model_dir is None:
+            model_dir = tmp_dir
+            build_model_dir(model_dir, args.n_estimators, args.max_depth, with_arrays=True)
+        model = inference.model_fn(model_dir)
+
+        results = {}
+        for name, size, quantize in [("no_cache", 0, ""), ("exact_cache", args.cache_size, ""),
+                                     ("quantized_cache", args.cache_size, args.cache_quantize)]:
+            inference.configure_cache(model, size, args.cache_ttl, quantize)
+            results[name] = replay(model, bodies)
+
+    saved = 1 - results["quantized_cache"]["cpu_seconds"] / results["no_cache"]["cpu_seconds"]
+    print(json.dumps(dict(requests=len(bodies), cpu_saved=round(saved, 3), **results), indent=2))
+
+
+if __name__ == "__main__":
+    main()
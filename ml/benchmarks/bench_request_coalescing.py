@@ -0,0 +1,64 @@
+"""Throughput and tail latency of single-trip requests with and without micro-batching.
+
+Replays a JSONL file with one JSON request body per line (generated from
+synthetic trips when --requests is omitted) against the local server.
+
+    python ml/benchmarks/bench_request_coalescing.py --concurrency 32 --max_batch_size 256 --max_wait_ms 2
+"""
+import argparse
+import json
+import tempfile
+
+from bench_inference_server import build_model_dir, json_requests, latency_report, replay, start_server
+
+
+def load_requests(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def run(model_dir, port, requests, concurrency, server_args):
+    server = start_server(model_dir, port, server_args)
+    try:
+        replay(port, requests[:200], concurrency)
+        latencies, seconds = replay(port, requests, concurrency)
+    finally:
+        server.terminate()
+        server.wait()
+    return latency_report(latencies, seconds, len(requests))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", default=None, help="JSONL replay file, one JSON request body per line")
+    parser.add_argument("--n_requests", type=int, default=5000)
+    parser.add_argument("--model_dir", default=None, help="Existing model dir; a forest is trained when omitted")
+    parser.add_argument("--n_estimators", type=int, default=200)
+    parser.add_argument("--max_depth", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--max_batch_size", type=int, default=256)
+    parser.add_argument("--max_wait_ms", type=float, default=2.0)
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+
+    bodies = load_requests(args.requests) if args.requests else json_requests(args.n_requests)
+    requests = [(body, "application/json") for body in bodies]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_dir = args.model_dir
+        if model_dir is None:
+            model_dir = tmp_dir
+            build_model_dir(model_dir, args.n_estimators, args.max_depth, with_arrays=True)
+        results = {
+            "without_coalescing": run(model_dir, args.port, requests, args.concurrency, []),
+            "with_coalescing": run(model_dir, args.port, requests, args.concurrency,
+                                   ["--max_batch_size", str(args.max_batch_size),
+                                    "--max_wait_ms", str(args.max_wait_ms)]),
+        }
+
+    print(json.dumps(dict(concurrency=args.concurrency, max_batch_size=args.max_batch_size,
+                          max_wait_ms=args.max_wait_ms, **results), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Arrow schema of the public yellow_tripdata parquet files (2025 layout).
+TRIP_SCHEMA = pa.schema([
+    ("VendorID", pa.int32()),
+    ("tpep_pickup_datetime", pa.timestamp("us")),
+    ("tpep_dropoff_datetime", pa.timestamp("us")),
+    ("passenger_count", pa.int64()),
+    ("trip_distance", pa.float64()),
+    ("RatecodeID", pa.int64()),
+    ("store_and_fwd_flag", pa.string()),
+    ("PULocationID", pa.int32()),
+    ("DOLocationID", pa.int32()),
+    ("payment_type", pa.int64()),
+    ("fare_amount", pa.float64()),
+    ("extra", pa.float64()),
+    ("mta_tax", pa.float64()),
+    ("tip_amount", pa.float64()),
+    ("tolls_amount", pa.float64()),
+    ("improvement_surcharge", pa.float64()),
+    ("total_amount", pa.float64()),
+    ("congestion_surcharge", pa.float64()),
+    ("Airport_fee", pa.float64()),
+    ("cbd_congestion_fee", pa.float64()),
+])
+
+
+def generate_trips(n_rows, seed=0, start="2025-01-01", null_rate=0.03, duplicate_rate=0.01):
+    """Random trips with the yellow_tripdata schema.
+
+    A share of rows have null passenger_count/RatecodeID, non-positive
+    fares or zero distance, and duplicate_rate of rows repeat an earlier one,
+    so every branch of preprocessing has work to do.
+    """
+    rng = np.random.default_rng(seed)
+    pickup = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, 30 * 86400, n_rows), unit="s")
+    trip_distance = np.round(rng.gamma(1.5, 2.2, n_rows), 2)
+    trip_distance[rng.random(n_rows) < 0.02] = 0.0
+    fare_amount = np.round(3.0 + 2.8 * trip_distance + rng.normal(0, 2.5, n_rows), 2)
+    fare_amount[rng.random(n_rows) < 0.01] *= -1
+
+    passenger_count = pd.array(rng.integers(0, 7, n_rows), dtype="Int64")
+    ratecode = pd.array(rng.choice([1, 2, 3, 4, 5, 99], n_rows, p=[0.9, 0.04, 0.01, 0.01, 0.02, 0.02]), dtype="Int64")
+    missing = rng.random(n_rows) < null_rate
+    passenger_count[missing] = pd.NA
+    ratecode[missing] = pd.NA
+
+    trips = pd.DataFrame({
+        "VendorID": rng.choice([1, 2, 6, 7], n_rows).astype("int32"),
+        "tpep_pickup_datetime": pickup,
+        "tpep_dropoff_datetime": pickup + pd.to_timedelta(rng.integers(60, 3600, n_rows), unit="s"),
+        "passenger_count": passenger_count,
+        "trip_distance": trip_distance,
+        "RatecodeID": ratecode,
+        "store_and_fwd_flag": rng.choice(["N", "Y"], n_rows, p=[0.995, 0.005]),
+        "PULocationID": rng.integers(1, 266, n_rows).astype("int32"),
+        "DOLocationID": rng.integers(1, 266, n_rows).astype("int32"),
+        "payment_type": rng.choice([0, 1, 2, 3, 4], n_rows, p=[0.05, 0.75, 0.15, 0.03, 0.02]),
+        "fare_amount": fare_amount,
+        "extra": rng.choice([0.0, 1.0, 2.5, 5.0], n_rows),
+        "mta_tax": np.full(n_rows, 0.5),
+        "tip_amount": np.round(rng.exponential(2.0, n_rows), 2),
+        "tolls_amount": np.where(rng.random(n_rows) < 0.05, 6.94, 0.0),
+        "improvement_surcharge": np.full(n_rows, 1.0),
+        "total_amount": np.zeros(n_rows),
+        "congestion_surcharge": rng.choice([0.0, 2.5], n_rows),
+        "Airport_fee": rng.choice([0.0, 1.75], n_rows, p=[0.9, 0.1]),
+        "cbd_congestion_fee": rng.choice([0.0, 0.75], n_rows),
+    })
+    trips["total_amount"] = trips[["fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount",
+                                   "improvement_surcharge", "congestion_surcharge", "Airport_fee",
+                                   "cbd_congestion_fee"]].sum(axis=1)
+
+    n_duplicates = int(n_rows * duplicate_rate)
+    if n_duplicates:
+        rows = np.arange(n_rows)
+        rows[rng.integers(0, n_rows, n_duplicates)] = rng.integers(0, n_rows, n_duplicates)
+        trips = trips.iloc[rows].reset_index(drop=True)
+    return trips
+
+
+def write_trip_parquet(path, n_rows, row_group_size=1_000_000, seed=0, start="2025-01-01"):
+    """Write n_rows synthetic trips to path one row group at a time."""
+    with pq.ParquetWriter(path, TRIP_SCHEMA) as writer:
+        for chunk_number, chunk_start in enumerate(range(0, n_rows, row_group_size)):
+            chunk_rows = min(row_group_size, n_rows - chunk_start)
+            trips = generate_trips(chunk_rows, seed=(seed, chunk_number), start=start)
+            writer.write_table(pa.Table.from_pandas(trips, schema=TRIP_SCHEMA, preserve_index=False))
+    logging.info(f"Wrote {n_rows} synthetic trips to {path}")
+    return path
+
+
+def write_trip_months(output_dir, n_rows, n_months, row_group_size=1_000_000, seed=0, start="2025-01-01"):
+    """Write n_rows trips per month as yellow_tripdata_YYYY-MM.parquet files, like the public dataset."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for month in pd.date_range(start, periods=n_months, freq="MS"):
+        path = os.path.join(output_dir, f"yellow_tripdata_{month:%Y-%m}.parquet")
+        # Months get distinct seeds so their trips do not repeat each other.
+        month_seed = seed * 1_000_000 + month.year * 100 + month.month
+        paths.append(write_trip_parquet(path, n_rows, row_group_size, month_seed, start=f"{month:%Y-%m-%d}"))
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--output_path", help="Single parquet file")
+    output.add_argument("--output_dir", help="Directory of monthly yellow_tripdata_YYYY-MM.parquet files")
+    parser.add_argument("--n_rows", type=int, default=3_000_000, help="Rows per file")
+    parser.add_argument("--n_months", type=int, default=1)
+    parser.add_argument("--row_group_size", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", default="2025-01-01")
+    args = parser.parse_args()
+
+    if args.output_dir:
+        write_trip_months(args.output_dir, args.n_rows, args.n_months, args.row_group_size, args.seed, args.start)
+    else:
+        write_trip_parquet(args.output_path, args.n_rows, args.row_group_size, args.seed, args.start)
@@ -39,6 +39,45 @@ def fetch_metrics(model_package_arn, retries=5, delay=3):
 
 SNS_TOPIC_ARN = os.environ["SNS_TOPIC_ARN"]
 
+def slices_block(metrics):
+    """Worst test slices and predict latency, when the evaluation report has them."""
+    worst = metrics.get("test_worst_slices")
+    if not worst:
+        return ""
+    lines = ["", "WORST TEST SLICES"]
+    for column, slice_score in worst.items():
+        lines.append(
+            f"- {column}={slice_score['group']}: RMSE {slice_score['RMSE']:.2f}, "
+            f"MAE {slice_score['MAE']:.2f} ({slice_score['count']} trips)"
+        )
+    latency = metrics.get("latency", {}).get("test")
+    if latency:
+        lines += ["", "PREDICT LATENCY (test batches)",
+                  f"- p50 {latency['p50_ms']:.1f} ms, p99 {latency['p99_ms']:.1f} ms, "
+                  f"{latency['rows_per_second']:.0f} rows/s"]
+    return "\n".join(lines) + "\n"
+
+
+def distillation_block(metrics):
+    """The distilled student's scores next to the trained model's, when the evaluation report has them."""
+    lines = []
+    student = metrics.get("student_test_score")
+    if student:
+        lines += ["", f"STUDENT: {metrics.get('student_model', 'distilled student').upper()} (test)",
+                  f"- RMSE {student['RMSE']:.2f} ({metrics['student_RMSE_delta']:+.2f} vs {metrics.get('model', 'teacher')}), "
+                  f"MAE {student['MAE']:.2f}"]
+        student_latency = metrics.get("latency", {}).get("student_test")
+        if student_latency:
+            lines.append(f"- p50 {student_latency['p50_ms']:.1f} ms, "
+                         f"{student_latency['rows_per_second']:.0f} rows/s")
+    teacher = metrics.get("teacher_test_score")
+    if teacher:
+        lines += ["", f"TEACHER: {metrics.get('teacher_model', 'trained model').upper()} (test)",
+                  f"- RMSE {teacher['RMSE']:.2f} (student {metrics['student_RMSE_delta']:+.2f}), "
+                  f"MAE {teacher['MAE']:.2f}"]
+    return "\n".join(lines) + "\n" if lines else ""
+
+
 def lambda_handler(event, context):
     detail_type = event.get("detail-type")
     detail = event.get("detail", {})
@@ -60,7 +99,7 @@ def lambda_handler(event, context):
             test = metrics["test_score"]
             metrics_block = f"""
 
-📊 Evaluation Metrics
+📊 Evaluation Metrics ({metrics.get("model", "trained model")})
 
 TRAIN
 - RMSE: {train['RMSE']:.2f}
@@ -71,7 +110,7 @@ TEST
 - RMSE: {test['RMSE']:.2f}
 - MAE : {test['MAE']:.2f}
 - R2  : {test['R2']:.4f}
-"""
+{slices_block(metrics)}{distillation_block(metrics)}"""
         message = f"""
 ✅ Model Registered Successfully
 
@@ -0,0 +1,224 @@
+"""Run preprocessing, training, distillation and evaluation on this machine, without SageMaker.
+
+Each step runs its script in a subprocess against a work directory that
+mirrors the SageMaker layout (processing/input, processing/output,
+SM_CHANNEL_TRAIN, SM_MODEL_DIR, processing/evaluation). A step is skipped
+when its code, arguments and input hash match its last successful run.
+
+    python ml/pipelines/training_pipeline.py --local --input data/raw --work_dir local_run
+"""
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import subprocess
+
+from pipeline_config import (
+    DATASET_FORMAT, DATASET_COMPRESSION, TRAIN_FILE_NAME, TEST_FILE_NAME, SPLIT_KEY_COLUMNS, ZONE_FEATURES_DIR,
+)
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+STATE_NAME = "steps.json"
+REPORT_NAME = "run_report.json"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--local", action="store_true", help="Accepted for training_pipeline.py --local")
+    parser.add_argument("--input", required=True, help="Raw trip parquet file, directory or glob")
+    parser.add_argument("--work_dir", default="local_pipeline")
+    parser.add_argument("--n_estimators", type=int, default=200)
+    parser.add_argument("--max_depth", type=int, default=10)
+    parser.add_argument("--model_type", default="forest")
+    parser.add_argument("--training_mode", default="full")
+    parser.add_argument("--eval_train_sample_rows", type=int, default=1_000_000)
+    parser.add_argument("--force", action="store_true", help="Run every step even when its cache entry matches")
+    return parser.parse_args(argv)
+
+
+def hash_files(paths, memo):
+    """Content hash of files, memoized on (size, mtime) so unchanged large inputs are not re-read."""
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        stat = os.stat(path)
+        fingerprint = f"{stat.st_size}:{stat.st_mtime_ns}"
+        entry = memo.get(path)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            file_digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    file_digest.update(block)
+            entry = memo[path] = {"fingerprint": fingerprint, "sha256": file_digest.hexdigest()}
+        digest.update(os.path.basename(path).encode())
+        digest.update(entry["sha256"].encode())
+    return digest.hexdigest()
+
+
+def list_files(path, suffixes=None):
+    if os.path.isfile(path):
+        return [os.path.abspath(path)]
+    if not os.path.isdir(path):
+        return sorted(os.path.abspath(p) for p in glob.glob(path, recursive=True))
+    files = []
+    for root, _, names in os.walk(path):
+        files += [os.path.join(root, name) for name in names if not suffixes or name.endswith(suffixes)]
+    return sorted(os.path.abspath(f) for f in files)
+
+
+class Step:
+    def __init__(self, name, script, arguments, inputs, outputs, env=None):
+        self.name = name
+        self.script = script
+        self.arguments = [str(argument) for argument in arguments]
+        self.inputs = inputs
+        self.outputs = outputs
+        self.env = env or {}
+
+    def code_files(self):
+        return list_files(os.path.dirname(self.script), (".py",)) + list_files(os.path.join(SRC_DIR, "common"), (".py",))
+
+    def cache_key(self, memo):
+        digest = hashlib.sha256()
+        digest.update(json.dumps([self.name, self.arguments, sorted(self.env.items())]).encode())
+        digest.update(hash_files(self.code_files(), memo).encode())
+        for path in self.inputs:
+            digest.update(hash_files(list_files(path), memo).encode())
+        return digest.hexdigest()
+
+    def run(self):
+        """Run the script; return wall seconds and the peak RSS of it and its reaped workers in MB."""
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, self.script, *self.arguments], env={**os.environ, **self.env})
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode != 0:
+            raise RuntimeError(f"Step {self.name} failed with exit code {process.returncode}")
+        # Some scripts log errors and exit cleanly, so also require their outputs.
+        if not all(os.listdir(path) for path in self.outputs):
+            raise RuntimeError(f"Step {self.name} did not write its outputs {self.outputs}")
+        return time.perf_counter() - start, usage.ru_maxrss / 1024
+
+
+def build_steps(args, work_dir):
+    processing = os.path.join(work_dir, "processing")
+    processed = os.path.join(processing, "output")
+    model_dir = os.path.join(work_dir, "model")
+    student_dir = os.path.join(processing, "student")
+    evaluation_dir = os.path.join(processing, "evaluation")
+    input_path = os.path.abspath(args.input)
+    return [
+        Step(
+            "NYCTaxiPreprocessing",
+            os.path.join(SRC_DIR, "preprocessing", "load_data.py"),
+            [
+                "--input_file_path", input_path,
+                "--output_train_file_path", os.path.join(processed, TRAIN_FILE_NAME),
+                "--output_test_file_path", os.path.join(processed, TEST_FILE_NAME),
+                "--output_format", DATASET_FORMAT,
+                "--compression", DATASET_COMPRESSION,
+                "--cache_uri", os.path.join(work_dir, "cache", "preprocessing"),
+                "--split_mode", "hash",
+                "--split_key", *SPLIT_KEY_COLUMNS,
+                "--target", "fare_amount",
+                "--zone_features_dir", os.path.join(processed, ZONE_FEATURES_DIR),
+            ],
+            inputs=[input_path],
+            outputs=[processed],
+        ),
+        Step(
+            "NYCTaxiTraining",
+            os.path.join(SRC_DIR, "training", "train_model.py"),
+            [
+                "--n_estimators", args.n_estimators,
+                "--max_depth", args.max_depth,
+                "--random_state", 58,
+                "--model_type", args.model_type,
+                "--training_mode", args.training_mode,
+                "--batch_rows", 1_000_000,
+                "--train_file_name", TRAIN_FILE_NAME,
+                "--target", "fare_amount",
+            ],
+            inputs=[os.path.join(processed, TRAIN_FILE_NAME), os.path.join(processed, ZONE_FEATURES_DIR)],
+            outputs=[model_dir],
+            env={"SM_CHANNEL_TRAIN": processed, "SM_MODEL_DIR": model_dir},
+        ),
+        Step(
+            "NYCTaxiDistillation",
+            os.path.join(SRC_DIR, "training", "distill.py"),
+            [
+                "--model_dir", model_dir,
+                "--data_dir", processed,
+                "--output_dir", student_dir,
+                "--train_file_name", TRAIN_FILE_NAME,
+                "--target", "fare_amount",
+            ],
+            inputs=[model_dir, os.path.join(processed, TRAIN_FILE_NAME)],
+            outputs=[student_dir],
+        ),
+        Step(
+            "NYCTaxiEvaluation",
+            os.path.join(SRC_DIR, "evaluation", "evaluate.py"),
+            [
+                "--model_name", "model.pkl",
+                "--model_dir", model_dir,
+                "--data_dir", processed,
+                "--output_dir", evaluation_dir,
+                "--train_file_name", TRAIN_FILE_NAME,
+                "--test_file_name", TEST_FILE_NAME,
+                "--target", "fare_amount",
+                "--train_sample_rows", args.eval_train_sample_rows,
+                "--student_dir", student_dir,
+            ],
+            inputs=[model_dir, processed, student_dir],
+            outputs=[evaluation_dir],
+        ),
+    ]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = os.path.abspath(args.work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    state_path = os.path.join(work_dir, STATE_NAME)
+    state = {"steps": {}, "file_hashes": {}}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+
+    report = []
+    for step in build_steps(args, work_dir):
+        key = step.cache_key(state["file_hashes"])
+        cached = state["steps"].get(step.name)
+        outputs_exist = all(os.path.exists(path) and os.listdir(path) for path in step.outputs)
+        if not args.force and cached and cached["key"] == key and outputs_exist:
+            report.append({"step": step.name, "status": "cached", **cached["timing"]})
+            print(f"{step.name}: cached ({cached['timing']['seconds']:.1f}s when last run)", flush=True)
+            continue
+
+        for path in step.outputs:
+            shutil.rmtree(path, ignore_errors=True)
+            os.makedirs(path)
+        seconds, peak_rss_mb = step.run()
+        timing = {"seconds": round(seconds, 2), "peak_rss_mb": round(peak_rss_mb, 1)}
+        state["steps"][step.name] = {"key": key, "timing": timing}
+        with open(state_path, "w") as f:
+            json.dump(state, f, indent=1)
+        report.append({"step": step.name, "status": "ran", **timing})
+        print(f"{step.name}: ran in {seconds:.1f}s, peak RSS {peak_rss_mb:.0f} MB", flush=True)
+
+    with open(os.path.join(work_dir, REPORT_NAME), "w") as f:
+        json.dump(report, f, indent=2)
+    evaluation_path = os.path.join(work_dir, "processing", "evaluation", "evaluation.json")
+    with open(evaluation_path) as f:
+        scores = json.load(f)
+    print(f"test_score: {scores['test_score']}")
+    print(f"student_test_score: {scores['student_test_score']} (RMSE delta {scores['student_RMSE_delta']:+.4f})")
+    print(f"Step report written to {os.path.join(work_dir, REPORT_NAME)}")
+
+
+if __name__ == "__main__":
+    main()
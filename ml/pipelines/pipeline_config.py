@@ -5,3 +5,19 @@ PROCESSED_BUCKET = "amazon-sagemaker-818831377059-us-east-1-5pw9jlcsj48rs7"
 PROCESSED_FOLDER = "/data/processed/v1"
 
 ROLE = "arn:aws:iam::818831377059:role/sagemaker_execusion_role"
+
+COMMON_DEPENDENCIES = ["ml/src/common"]
+
+# Train/test hand-off between preprocessing, training and evaluation.
+# Uncompressed feather is memory-mapped by the training and evaluation jobs.
+DATASET_FORMAT = "feather"
+DATASET_COMPRESSION = "uncompressed"
+TRAIN_FILE_NAME = f"train.{DATASET_FORMAT}"
+TEST_FILE_NAME = f"test.{DATASET_FORMAT}"
+
+# Columns hashed to assign a trip to train or test
+SPLIT_KEY_COLUMNS = ["trip_distance", "PULocationID", "DOLocationID", "payment_type", "fare_amount"]
+
+# Zone feature store written next to train/test by preprocessing and saved
+# with the model; matches common.zone_features.ZONE_FEATURES_DIR
+ZONE_FEATURES_DIR = "zone_features"
@@ -1,14 +1,23 @@
+import sys
 import argparse
+
+# --local runs the steps on this machine (see local_pipeline.py) and needs neither
+# SageMaker nor AWS credentials, so it is dispatched before the session below is created.
+if __name__ == "__main__" and "--local" in sys.argv[1:]:
+    import local_pipeline
+    local_pipeline.main(sys.argv[1:])
+    sys.exit(0)
+
 import sagemaker
 from sagemaker.workflow.pipeline import Pipeline
 from sagemaker.workflow.steps import TrainingStep, ProcessingStep
-from sagemaker.sklearn.processing import SKLearnProcessor
-from sagemaker.processing import ProcessingInput, ProcessingOutput
+from sagemaker.processing import FrameworkProcessor, ProcessingInput, ProcessingOutput
 from sagemaker.sklearn.estimator import SKLearn
-from sagemaker.workflow.parameters import ParameterString, ParameterInteger
+from sagemaker.workflow.parameters import ParameterString, ParameterInteger, ParameterFloat
 from sagemaker.workflow.conditions import ConditionLessThanOrEqualTo
 from sagemaker.workflow.condition_step import ConditionStep
 from sagemaker.workflow.functions import JsonGet, Join
+from sagemaker.workflow.execution_variables import ExecutionVariables
 from sagemaker.inputs import TrainingInput
 from sagemaker.workflow.properties import PropertyFile
 from sagemaker.workflow.model_step import ModelStep
@@ -16,7 +25,10 @@ from sagemaker.model_metrics import MetricsSource, ModelMetrics
 from sagemaker.workflow.pipeline_context import PipelineSession
 from sagemaker.sklearn.model import SKLearnModel
 
-from pipeline_config import RAW_BUCKT, ROLE
+from pipeline_config import (
+    RAW_BUCKT, ROLE, COMMON_DEPENDENCIES, DATASET_FORMAT, DATASET_COMPRESSION,
+    TRAIN_FILE_NAME, TEST_FILE_NAME, SPLIT_KEY_COLUMNS, ZONE_FEATURES_DIR,
+)
 
 # ---------------------------------------------------------------------
 # ARGUMENTS
@@ -33,6 +45,11 @@ def parse_args():
         action="store_true",
         help="CD/orchestration mode: upsert pipeline"
     )
+    parser.add_argument(
+        "--local",
+        action="store_true",
+        help="Dev mode: run preprocessing, training and evaluation locally (options in local_pipeline.py)"
+    )
     return parser.parse_args()
 
 # ---------------------------------------------------------------------
@@ -51,10 +68,50 @@ n_estimators = ParameterInteger(
     default_value=200
 )
 
+max_depth = ParameterInteger(
+    name="MaxDepth",
+    default_value=10
+)
+
+# "forest" (RandomForestRegressor) or "hist_gbm" (HistGradientBoostingRegressor)
+model_type = ParameterString(
+    name="ModelType",
+    default_value="forest"
+)
+
+# "full" fits on all rows at once; "incremental" grows the forest over batches;
+# "search" picks the forest's hyperparameters by successive halving, writes
+# leaderboard.json next to the model and ignores n_estimators/MaxDepth
+training_mode = ParameterString(
+    name="TrainingMode",
+    default_value="full"
+)
+
+# Rows of train scored for train_score; 0 scores the whole training set
+eval_train_sample_rows = ParameterInteger(
+    name="EvalTrainSampleRows",
+    default_value=1_000_000
+)
+
+# Registration also requires the worst test slice (zone, distance bucket or
+# payment type with enough rows) to stay under this RMSE
+max_slice_rmse = ParameterFloat(
+    name="MaxSliceRMSE",
+    default_value=3000.0
+)
+
+# The distilled student is registered for serving instead of the forest when
+# its test RMSE is at most this much above the forest's
+distill_rmse_budget = ParameterFloat(
+    name="DistillRMSEBudget",
+    default_value=0.25
+)
+
 # ---------------------------------------------------------------------
 # PROCESSING STEP
 # ---------------------------------------------------------------------
-processor = SKLearnProcessor(
+processor = FrameworkProcessor(
+    estimator_cls=SKLearn,
     framework_version="1.2-1",
     role=role,
     instance_type="ml.t3.xlarge",
@@ -65,27 +122,36 @@ processor = SKLearnProcessor(
 
 processing_step = ProcessingStep(
     name="NYCTaxiPreprocessing",
-    processor=processor,
-    inputs=[
-        ProcessingInput(
-            source=Join(on="/", values=["s3:/", unified_bucket, "data/raw/v1"]),
-            destination="/opt/ml/processing/input",
-        )
-    ],
-    outputs=[
-        ProcessingOutput(
-            source="/opt/ml/processing/output",
-            output_name="processed",
-            destination=Join(on="/", values=["s3:/", unified_bucket, "data/processed/v1"]),
-        )
-    ],
-    code="ml/src/preprocessing/load_data.py",
-    job_arguments=[
-        "--input_file_path", "/opt/ml/processing/input/yellow_tripdata_v1.parquet",
-        "--output_train_file_path", "/opt/ml/processing/output/train.csv",
-        "--output_test_file_path", "/opt/ml/processing/output/test.csv",
-        "--target", "fare_amount",
-    ],
+    step_args=processor.run(
+        code="load_data.py",
+        source_dir="ml/src/preprocessing",
+        dependencies=COMMON_DEPENDENCIES,
+        inputs=[
+            ProcessingInput(
+                source=Join(on="/", values=["s3:/", unified_bucket, "data/raw/v1"]),
+                destination="/opt/ml/processing/input",
+            )
+        ],
+        outputs=[
+            ProcessingOutput(
+                source="/opt/ml/processing/output",
+                output_name="processed",
+                destination=Join(on="/", values=["s3:/", unified_bucket, "data/processed/v1"]),
+            )
+        ],
+        arguments=[
+            "--input_file_path", "/opt/ml/processing/input",
+            "--output_train_file_path", f"/opt/ml/processing/output/{TRAIN_FILE_NAME}",
+            "--output_test_file_path", f"/opt/ml/processing/output/{TEST_FILE_NAME}",
+            "--output_format", DATASET_FORMAT,
+            "--compression", DATASET_COMPRESSION,
+            "--cache_uri", Join(on="/", values=["s3:/", unified_bucket, "cache/preprocessing/v1"]),
+            "--split_mode", "hash",
+            "--split_key", *SPLIT_KEY_COLUMNS,
+            "--target", "fare_amount",
+            "--zone_features_dir", f"/opt/ml/processing/output/{ZONE_FEATURES_DIR}",
+        ],
+    ),
 )
 
 # ---------------------------------------------------------------------
@@ -94,17 +160,26 @@ processing_step = ProcessingStep(
 estimator = SKLearn(
     entry_point="train_model.py",
     source_dir="ml/src/training",
+    dependencies=COMMON_DEPENDENCIES,
     framework_version="1.2-1",
     role=role,
     instance_type="ml.m5.xlarge",
     instance_count=1,
     hyperparameters={
         "n_estimators": n_estimators,
-        "max_depth": 10,
+        "max_depth": max_depth,
         "random_state": 58,
-        "train_file_name": "train.csv",
+        "model_type": model_type,
+        "training_mode": training_mode,
+        "batch_rows": 1_000_000,
+        "train_file_name": TRAIN_FILE_NAME,
         "target": "fare_amount",
     },
+    metric_definitions=[
+        {"Name": "train:rows_per_second", "Regex": "rows_per_second=([0-9.]+)"},
+        {"Name": "train:peak_rss_mb", "Regex": "peak_rss_mb=([0-9.]+)"},
+        {"Name": "train:search_best_rmse", "Regex": "search_best_rmse=([0-9.]+)"},
+    ],
     sagemaker_session=session,
     output_path=Join(on="/", values=["s3:/", unified_bucket, "models"]),
 )
@@ -121,6 +196,61 @@ training_step = TrainingStep(
     },
 )
 
+# ---------------------------------------------------------------------
+# DISTILLATION STEP
+# ---------------------------------------------------------------------
+distill_processor = FrameworkProcessor(
+    estimator_cls=SKLearn,
+    framework_version="1.2-1",
+    role=role,
+    instance_type="ml.m5.xlarge",
+    instance_count=1,
+    base_job_name="nyc-taxi-distillation",
+    sagemaker_session=session,
+)
+
+distillation_step = ProcessingStep(
+    name="NYCTaxiDistillation",
+    step_args=distill_processor.run(
+        code="distill.py",
+        source_dir="ml/src/training",
+        dependencies=COMMON_DEPENDENCIES,
+        inputs=[
+            ProcessingInput(
+                source=training_step.properties.ModelArtifacts.S3ModelArtifacts,
+                destination="/opt/ml/processing/model",
+            ),
+            ProcessingInput(
+                source=processing_step.properties
+                .ProcessingOutputConfig.Outputs["processed"]
+                .S3Output.S3Uri,
+                destination="/opt/ml/processing/input",
+            ),
+        ],
+        outputs=[
+            ProcessingOutput(
+                source="/opt/ml/processing/student",
+                output_name="student",
+                # One key per execution, so a registered student is never overwritten by a later run.
+                destination=Join(on="/", values=["s3:/", unified_bucket, "models", "student",
+                                                 ExecutionVariables.PIPELINE_EXECUTION_ID]),
+            )
+        ],
+        arguments=[
+            "--train_file_name", TRAIN_FILE_NAME,
+            "--target", "fare_amount",
+        ],
+    ),
+)
+
+student_model_data = Join(
+    on="/",
+    values=[
+        distillation_step.properties.ProcessingOutputConfig.Outputs["student"].S3Output.S3Uri,
+        "model.tar.gz",
+    ],
+)
+
 # ---------------------------------------------------------------------
 # EVALUATION STEP
 # ---------------------------------------------------------------------
@@ -130,7 +260,8 @@ evaluation_report = PropertyFile(
     path="evaluation.json",
 )
 
-eval_processor = SKLearnProcessor(
+eval_processor = FrameworkProcessor(
+    estimator_cls=SKLearn,
     framework_version="1.2-1",
     role=role,
     instance_type="ml.t3.xlarge",
@@ -141,36 +272,48 @@ eval_processor = SKLearnProcessor(
 
 evaluation_step = ProcessingStep(
     name="NYCTaxiEvaluation",
-    processor=eval_processor,
-    inputs=[
-        ProcessingInput(
-            source=training_step.properties.ModelArtifacts.S3ModelArtifacts,
-            destination="/opt/ml/processing/model",
-        ),
-        ProcessingInput(
-            source=processing_step.properties
-            .ProcessingOutputConfig.Outputs["processed"]
-            .S3Output.S3Uri,
-            destination="/opt/ml/processing/input",
-            input_name="data",
-        ),
-    ],
-    outputs=[
-        ProcessingOutput(
-            source="/opt/ml/processing/evaluation",
-            output_name="evaluation",
-            destination=Join(on="/", values=["s3:/", unified_bucket, "evaluation"]),
-        )
-    ],
-    code="ml/src/evaluation/evaluate.py",
-    job_arguments=[
-        "--model_name", "model.pkl",
-        "--model_dir", "/opt/ml/processing/model",
-        "--data_dir", "/opt/ml/processing/input",
-        "--train_file_name", "train.csv",
-        "--test_file_name", "test.csv",
-        "--target", "fare_amount",
-    ],
+    step_args=eval_processor.run(
+        code="evaluate.py",
+        source_dir="ml/src/evaluation",
+        dependencies=COMMON_DEPENDENCIES,
+        inputs=[
+            ProcessingInput(
+                source=training_step.properties.ModelArtifacts.S3ModelArtifacts,
+                destination="/opt/ml/processing/model",
+            ),
+            ProcessingInput(
+                source=processing_step.properties
+                .ProcessingOutputConfig.Outputs["processed"]
+                .S3Output.S3Uri,
+                destination="/opt/ml/processing/input",
+                input_name="data",
+            ),
+            ProcessingInput(
+                source=distillation_step.properties
+                .ProcessingOutputConfig.Outputs["student"]
+                .S3Output.S3Uri,
+                destination="/opt/ml/processing/student",
+                input_name="student",
+            ),
+        ],
+        outputs=[
+            ProcessingOutput(
+                source="/opt/ml/processing/evaluation",
+                output_name="evaluation",
+                destination=Join(on="/", values=["s3:/", unified_bucket, "evaluation"]),
+            )
+        ],
+        arguments=[
+            "--model_name", "model.pkl",
+            "--model_dir", "/opt/ml/processing/model",
+            "--data_dir", "/opt/ml/processing/input",
+            "--train_file_name", TRAIN_FILE_NAME,
+            "--test_file_name", TEST_FILE_NAME,
+            "--target", "fare_amount",
+            "--train_sample_rows", eval_train_sample_rows.to_string(),
+            "--student_dir", "/opt/ml/processing/student",
+        ],
+    ),
     property_files=[evaluation_report],
 )
 
@@ -181,6 +324,7 @@ def build_pipeline(register_model: bool) -> Pipeline:
     steps = [
         processing_step,
         training_step,
+        distillation_step,
         evaluation_step,
     ]
 
@@ -194,50 +338,82 @@ def build_pipeline(register_model: bool) -> Pipeline:
             right=3000,
         )
 
-        model_metrics = ModelMetrics(
-            model_statistics=MetricsSource(
-                s3_uri=Join(
-                    on="/",
-                    values=[
-                        evaluation_step.properties
-                        .ProcessingOutputConfig.Outputs["evaluation"]
-                        .S3Output.S3Uri,
-                        "evaluation.json",
-                    ],
-                ),
-                content_type="application/json",
-            )
+        slice_rmse_condition = ConditionLessThanOrEqualTo(
+            left=JsonGet(
+                step_name=evaluation_step.name,
+                property_file=evaluation_report,
+                json_path="$.test_worst_slice_RMSE",
+            ),
+            right=max_slice_rmse,
         )
 
-        model = SKLearnModel(
-            model_data=training_step.properties.ModelArtifacts.S3ModelArtifacts,
-            role=role,
-            entry_point="train_model.py",
-            source_dir="ml/src/training",
-            framework_version="1.2-1",
-            sagemaker_session=session,
-        )
+        def model_metrics(report_name):
+            return ModelMetrics(
+                model_statistics=MetricsSource(
+                    s3_uri=Join(
+                        on="/",
+                        values=[
+                            evaluation_step.properties
+                            .ProcessingOutputConfig.Outputs["evaluation"]
+                            .S3Output.S3Uri,
+                            report_name,
+                        ],
+                    ),
+                    content_type="application/json",
+                )
+            )
+
+        def register_step(name, model_data, report_name, description):
+            model = SKLearnModel(
+                model_data=model_data,
+                role=role,
+                entry_point="inference.py",
+                source_dir="ml/src/inference",
+                dependencies=COMMON_DEPENDENCIES,
+                framework_version="1.2-1",
+                sagemaker_session=session,
+            )
 
-        register_step_args = model.register(
-            content_types=["text/csv"],
-            response_types=["text/csv"],
-            inference_instances=["ml.m5.large"],
-            transform_instances=["ml.m5.xlarge"],
-            model_package_group_name="NYCTaxiFareModels",
-            model_metrics=model_metrics,
-            approval_status="PendingManualApproval",
-            description="NYC Taxi Fare Prediction model",
+            register_step_args = model.register(
+                content_types=["text/csv", "application/json", "application/x-npy"],
+                response_types=["text/csv", "application/json", "application/x-npy"],
+                inference_instances=["ml.m5.large"],
+                transform_instances=["ml.m5.xlarge"],
+                model_package_group_name="NYCTaxiFareModels",
+                model_metrics=model_metrics(report_name),
+                approval_status="PendingManualApproval",
+                description=description,
+            )
+
+            return ModelStep(
+                name=name,
+                step_args=register_step_args,
+            )
+
+        student_delta_condition = ConditionLessThanOrEqualTo(
+            left=JsonGet(
+                step_name=evaluation_step.name,
+                property_file=evaluation_report,
+                json_path="$.student_RMSE_delta",
+            ),
+            right=distill_rmse_budget,
         )
 
-        register_step = ModelStep(
-            name="RegisterModel",
-            step_args=register_step_args,
+        # Serve the distilled student when it is close enough to the forest
+        distillation_check = ConditionStep(
+            name="DistillationCheck",
+            conditions=[student_delta_condition],
+            if_steps=[register_step("RegisterStudentModel", student_model_data, "student_evaluation.json",
+                                    "NYC Taxi Fare Prediction model (distilled student)")],
+            else_steps=[register_step("RegisterModel",
+                                      training_step.properties.ModelArtifacts.S3ModelArtifacts,
+                                      "evaluation.json", "NYC Taxi Fare Prediction model")],
         )
 
         condition_step = ConditionStep(
             name="RMSECheck",
-            conditions=[rmse_condition],
-            if_steps=[register_step],
+            conditions=[rmse_condition, slice_rmse_condition],
+            if_steps=[distillation_check],
             else_steps=[],
         )
 
@@ -245,7 +421,8 @@ def build_pipeline(register_model: bool) -> Pipeline:
 
     return Pipeline(
         name="NYCTaxiFarePredictionPipeline",
-        parameters=[unified_bucket, n_estimators],
+        parameters=[unified_bucket, n_estimators, max_depth, model_type, training_mode,
+                    eval_train_sample_rows, max_slice_rmse, distill_rmse_budget],
         steps=steps,
         sagemaker_session=session,
     )
@@ -271,5 +448,5 @@ if __name__ == "__main__":
 
     else:
         raise RuntimeError(
-            "You must specify --validate-only (CI) or --execute (CD/orchestration)"
+            "You must specify --validate-only (CI), --execute (CD/orchestration) or --local (dev)"
         )
@@ -0,0 +1,285 @@
+import json
+import math
+import logging
+import numpy as np
+import pandas as pd
+
+PROFILE_NAME = "profile.json"
+
+# Column of a model dir's profile.json holding the model's own predictions on training rows
+PREDICTION_COLUMN = "prediction"
+
+# Quantiles written to the profile summary; any other can be read from the sketch.
+QUANTILES = (0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with relative error (DDSketch-style log buckets).
+
+    A value v > 0 is counted in bucket ceil(log_gamma(v)), so every quantile
+    is returned within relative_accuracy of a value in its bucket. Negative
+    values use a mirrored set of buckets and values within min_value of zero
+    a single zero bucket. Buckets are dense count arrays starting at an
+    offset, so updates are one bincount and merges are array additions.
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.zero_count = 0
+        self.positive = (0, np.zeros(0, dtype=np.int64))
+        self.negative = (0, np.zeros(0, dtype=np.int64))
+
+    @property
+    def count(self):
+        return int(self.zero_count + self.positive[1].sum() + self.negative[1].sum())
+
+    @staticmethod
+    def _add(store, offset, counts):
+        store_offset, store_counts = store
+        if not store_counts.size:
+            return offset, counts
+        if not counts.size:
+            return store
+        lo = min(store_offset, offset)
+        hi = max(store_offset + store_counts.size, offset + counts.size)
+        merged = np.zeros(hi - lo, dtype=np.int64)
+        merged[store_offset - lo:store_offset - lo + store_counts.size] += store_counts
+        merged[offset - lo:offset - lo + counts.size] += counts
+        return lo, merged
+
+    def _bucket_counts(self, magnitudes):
+        if not magnitudes.size:
+            return 0, np.zeros(0, dtype=np.int64)
+        index = np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+        offset = int(index.min())
+        return offset, np.bincount(index - offset)
+
+    def update(self, values: np.ndarray):
+        """Add finite values."""
+        values = np.asarray(values, dtype=np.float64)
+        if values.size and values.min() >= self.min_value:
+            # all positive, the common case for trip columns
+            self.positive = self._add(self.positive, *self._bucket_counts(values))
+            return self
+        is_zero = np.abs(values) < self.min_value
+        self.zero_count += int(is_zero.sum())
+        self.positive = self._add(self.positive, *self._bucket_counts(values[~is_zero & (values > 0)]))
+        self.negative = self._add(self.negative, *self._bucket_counts(-values[~is_zero & (values < 0)]))
+        return self
+
+    def merge(self, other: "QuantileSketch"):
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        self.zero_count += other.zero_count
+        self.positive = self._add(self.positive, *other.positive)
+        self.negative = self._add(self.negative, *other.negative)
+        return self
+
+    def bucket_values(self):
+        """Representative value and count of every non-empty bucket, in increasing value order."""
+        def values(store):
+            offset, counts = store
+            index = np.arange(offset, offset + counts.size)
+            return 2 * self.gamma ** index / (self.gamma + 1), counts
+
+        negative_values, negative_counts = values(self.negative)
+        positive_values, positive_counts = values(self.positive)
+        all_values = np.concatenate([-negative_values[::-1], [0.0], positive_values])
+        all_counts = np.concatenate([negative_counts[::-1], [self.zero_count], positive_counts])
+        keep = all_counts > 0
+        return all_values[keep], all_counts[keep]
+
+    def quantiles(self, qs):
+        values, counts = self.bucket_values()
+        if not counts.size:
+            return [None] * len(qs)
+        cumulative = np.cumsum(counts)
+        ranks = np.asarray(qs, dtype=np.float64) * (cumulative[-1] - 1)
+        return values[np.searchsorted(cumulative, ranks, side="right")].tolist()
+
+    def bucket_upper_bounds(self, values):
+        """Upper bound of the bucket holding each value: a value is in or below a bucket iff it is <= the bound."""
+        values = np.asarray(values, dtype=np.float64)
+        magnitudes = np.maximum(np.abs(values), self.min_value)
+        index = np.ceil(np.log(magnitudes) / self._log_gamma)
+        return np.where(np.abs(values) < self.min_value, 0.0,
+                        np.where(values > 0, self.gamma ** index, -self.gamma ** (index - 1)))
+
+    def histogram(self, edges):
+        """Counts in the bins (-inf, edges[0]], (edges[0], edges[1]], ..., (edges[-1], inf), bucket by bucket.
+
+        Exact when the edges are bucket upper bounds, as from bucket_upper_bounds.
+        """
+        values, counts = self.bucket_values()
+        bins = np.searchsorted(edges, values, side="left")
+        return np.bincount(bins, weights=counts, minlength=len(edges) + 1)
+
+    def to_dict(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "min_value": self.min_value,
+            "zero_count": self.zero_count,
+            "positive": {"offset": self.positive[0], "counts": self.positive[1].tolist()},
+            "negative": {"offset": self.negative[0], "counts": self.negative[1].tolist()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["relative_accuracy"], data["min_value"])
+        sketch.zero_count = data["zero_count"]
+        for name in ("positive", "negative"):
+            store = data[name]
+            setattr(sketch, name, (store["offset"], np.asarray(store["counts"], dtype=np.int64)))
+        return sketch
+
+
+class HyperLogLog:
+    """Mergeable distinct-count estimate from 2**precision one-byte registers."""
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, values: np.ndarray):
+        if not len(values):
+            return self
+        # Registers ignore repeats, and trip columns have few distinct values, so hash each value once.
+        hashes = pd.util.hash_array(np.unique(values))
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rest_bits = 64 - self.precision
+        rest = hashes & np.uint64((1 << rest_bits) - 1)
+        # frexp's exponent is the bit length (0 for 0), so rank is the position of the first set bit.
+        rank = rest_bits + 1 - np.frexp(rest.astype(np.float64))[1]
+        # Highest rank per register without ufunc.at: count (register, rank) pairs and take the last present rank.
+        seen = np.bincount(index * (rest_bits + 2) + rank,
+                           minlength=self.registers.size * (rest_bits + 2)).reshape(self.registers.size, -1) > 0
+        chunk_registers = np.where(seen.any(axis=1), rest_bits + 1 - np.argmax(seen[:, ::-1], axis=1), 0)
+        np.maximum(self.registers, chunk_registers.astype(np.uint8), out=self.registers)
+        return self
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = self.registers.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype(np.float64))
+        zeros = int((self.registers == 0).sum())
+        if estimate <= 2.5 * m and zeros:
+            # linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class ColumnProfile:
+    """Null count, min/max/mean, quantile sketch and distinct count of one numeric column."""
+
+    def __init__(self):
+        self.count = 0
+        self.nulls = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch()
+        self.distinct = HyperLogLog()
+
+    def update(self, values: np.ndarray):
+        is_null = np.isnan(values)
+        values = values[~is_null]
+        self.nulls += int(is_null.sum())
+        if values.size:
+            self.count += int(values.size)
+            self.total += float(values.sum())
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+            self.sketch.update(values)
+            self.distinct.update(values)
+        return self
+
+    def merge(self, other: "ColumnProfile"):
+        self.count += other.count
+        self.nulls += other.nulls
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+        self.distinct.merge(other.distinct)
+        return self
+
+    def result(self):
+        empty = self.count == 0
+        return {
+            "count": self.count,
+            "nulls": self.nulls,
+            "min": None if empty else self.min,
+            "max": None if empty else self.max,
+            "mean": None if empty else self.total / self.count,
+            "distinct": self.distinct.estimate(),
+            "quantiles": dict(zip(map(str, QUANTILES), self.sketch.quantiles(QUANTILES))),
+            "sketch": self.sketch.to_dict(),
+        }
+
+
+class DataProfile:
+    """Per-column profiles of a frame, updated chunk by chunk in one pass and mergeable across chunks."""
+
+    def __init__(self):
+        self.rows = 0
+        self.columns = {}
+
+    def update(self, data: pd.DataFrame, imputed=None):
+        """Add a chunk; imputed maps a column to a boolean mask of the rows whose value was filled in,
+        which are counted as nulls as well as profiled with their filled value."""
+        self.rows += len(data)
+        imputed = imputed or {}
+        for name in data.columns:
+            values = data[name].to_numpy(dtype=np.float64, na_value=np.nan)
+            column = self.columns.setdefault(name, ColumnProfile()).update(values)
+            if name in imputed:
+                column.nulls += int(np.count_nonzero(imputed[name]))
+        return self
+
+    def merge(self, other: "DataProfile"):
+        self.rows += other.rows
+        for name, column in other.columns.items():
+            if name in self.columns:
+                self.columns[name].merge(column)
+            else:
+                self.columns[name] = column
+        return self
+
+    def result(self):
+        return {"rows": self.rows, "columns": {name: column.result() for name, column in self.columns.items()}}
+
+
+def write_profiles(profiles, path):
+    """Write {split: DataProfile} as one JSON document."""
+    with open(path, "w") as f:
+        json.dump({split: profile.result() for split, profile in profiles.items()}, f, separators=(",", ":"))
+    logging.info(f"Profile of {', '.join(f'{split} ({p.rows} rows)' for split, p in profiles.items())} "
+                 f"written to {path}")
+
+
+def write_model_profile(profile_path, predictions, path):
+    """Copy the train/test profile at profile_path to path, adding the model's predictions on training rows
+    to the train split as PREDICTION_COLUMN, the reference for the drift of served predictions."""
+    with open(profile_path) as f:
+        profiles = json.load(f)
+    column = ColumnProfile().update(np.asarray(predictions, dtype=np.float64))
+    profiles["train"]["columns"][PREDICTION_COLUMN] = column.result()
+    with open(path, "w") as f:
+        json.dump(profiles, f, separators=(",", ":"))
+    logging.info(f"Profile with {column.count} training predictions written to {path}")
+
+
+def load_profile(path, split="train"):
+    """Summary of one split from a profile.json, with each column's sketch as a QuantileSketch."""
+    with open(path) as f:
+        profile = json.load(f)[split]
+    for column in profile["columns"].values():
+        column["sketch"] = QuantileSketch.from_dict(column["sketch"])
+    return profile
@@ -0,0 +1,175 @@
+import os
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+FORMATS = ("csv", "parquet", "feather")
+
+_EXTENSIONS = {".csv": "csv", ".parquet": "parquet", ".feather": "feather", ".arrow": "feather"}
+
+# Storage types of the processed trip columns. Columns not listed keep the
+# type Arrow infers from pandas.
+COLUMN_TYPES = {
+    "passenger_count": pa.int8(),
+    "trip_distance": pa.float32(),
+    "PULocationID": pa.int16(),
+    "DOLocationID": pa.int16(),
+    "payment_type": pa.int8(),
+    "fare_amount": pa.float32(),
+}
+
+
+def format_from_path(path):
+    extension = os.path.splitext(str(path))[1].lower()
+    if extension not in _EXTENSIONS:
+        raise ValueError(f"Cannot infer dataset format from {path}; expected one of {sorted(_EXTENSIONS)}")
+    return _EXTENSIONS[extension]
+
+
+def to_arrow_table(data: pd.DataFrame) -> pa.Table:
+    """Convert a processed frame to Arrow, casting known columns to COLUMN_TYPES."""
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    schema = pa.schema([
+        pa.field(name, COLUMN_TYPES.get(name, table.schema.field(name).type))
+        for name in table.column_names
+    ])
+    return table.cast(schema)
+
+
+def cast_frame(data: pd.DataFrame) -> pd.DataFrame:
+    """Apply COLUMN_TYPES to a frame read from a format that does not keep types."""
+    dtypes = {name: arrow_type.to_pandas_dtype() for name, arrow_type in COLUMN_TYPES.items()
+              if name in data.columns and not data[name].isna().any()}
+    return data.astype(dtypes)
+
+
+def write_dataset(data: pd.DataFrame, path, file_format=None, compression=None):
+    """Write a processed frame without its index.
+
+    compression is passed to the parquet or feather writer ("snappy", "zstd",
+    "lz4", "uncompressed", ...). Only uncompressed feather files can be
+    memory-mapped without a copy.
+    """
+    file_format = file_format or format_from_path(path)
+    if file_format == "csv":
+        data.to_csv(path, index=False)
+    elif file_format == "parquet":
+        pq.write_table(to_arrow_table(data), path, compression=compression or "snappy")
+    elif file_format == "feather":
+        table = to_arrow_table(data)
+        # a single record batch lets read_dataset hand out views on the mapped file
+        feather.write_feather(table, path, compression=compression or "lz4", chunksize=max(table.num_rows, 1))
+    else:
+        raise ValueError(f"Unsupported dataset format {file_format}; expected one of {FORMATS}")
+
+
+def read_dataset(path, file_format=None, columns=None, memory_map=False) -> pd.DataFrame:
+    """Read a dataset written by write_dataset.
+
+    With memory_map=True, parquet and feather files are mapped instead of
+    read into a buffer. For an uncompressed feather file holding a single
+    record batch, the numeric columns of the returned frame are views on the
+    mapped file; files appended by DatasetWriter are copied once on conversion.
+    """
+    file_format = file_format or format_from_path(path)
+    if file_format == "csv":
+        return cast_frame(pd.read_csv(path, usecols=columns))
+    if file_format == "parquet":
+        table = pq.read_table(path, columns=columns, memory_map=memory_map)
+    elif file_format == "feather":
+        table = feather.read_table(path, columns=columns, memory_map=memory_map)
+    else:
+        raise ValueError(f"Unsupported dataset format {file_format}; expected one of {FORMATS}")
+    logging.info(f"Read {table.num_rows} rows ({table.nbytes} bytes) from {path}")
+    return table.to_pandas(split_blocks=True)
+
+
+def dataset_num_rows(path, file_format=None):
+    """Row count of a dataset, from file metadata where the format has it."""
+    file_format = file_format or format_from_path(path)
+    if file_format == "csv":
+        with open(path) as f:
+            return max(sum(1 for _ in f) - 1, 0)
+    if file_format == "parquet":
+        return pq.ParquetFile(path).metadata.num_rows
+    reader = pa.ipc.open_file(pa.memory_map(str(path)))
+    return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+
+def _rechunk(record_batches, batch_rows):
+    pending, pending_rows = [], 0
+    for batch in record_batches:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        while pending_rows >= batch_rows:
+            table = pa.Table.from_batches(pending)
+            yield table.slice(0, batch_rows)
+            remainder = table.slice(batch_rows)
+            pending, pending_rows = remainder.to_batches(), remainder.num_rows
+    if pending_rows:
+        yield pa.Table.from_batches(pending)
+
+
+def iter_dataset_batches(path, batch_rows, file_format=None, columns=None):
+    """Yield a dataset as frames of batch_rows rows (the last may be shorter) without reading it whole."""
+    file_format = file_format or format_from_path(path)
+    if file_format == "csv":
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=batch_rows):
+            yield cast_frame(chunk)
+        return
+    if file_format == "parquet":
+        record_batches = pq.ParquetFile(path).iter_batches(batch_size=batch_rows, columns=columns)
+    elif file_format == "feather":
+        reader = pa.ipc.open_file(pa.memory_map(str(path)))
+        record_batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        if columns:
+            record_batches = (batch.select(columns) for batch in record_batches)
+    else:
+        raise ValueError(f"Unsupported dataset format {file_format}; expected one of {FORMATS}")
+    for table in _rechunk(record_batches, batch_rows):
+        yield table.to_pandas(split_blocks=True)
+
+
+class DatasetWriter:
+    """Append processed frames to one csv, parquet or feather file."""
+
+    def __init__(self, path, file_format=None, compression=None):
+        self.path = path
+        self.file_format = file_format or format_from_path(path)
+        if self.file_format not in FORMATS:
+            raise ValueError(f"Unsupported dataset format {self.file_format}; expected one of {FORMATS}")
+        self.compression = compression
+        self.rows_written = 0
+        self._writer = None
+
+    def write(self, data: pd.DataFrame):
+        if self.file_format == "csv":
+            data.to_csv(self.path, index=False, mode="w" if self._writer is None else "a",
+                        header=self._writer is None)
+            self._writer = self.path
+        else:
+            table = to_arrow_table(data)
+            if self._writer is None:
+                self._writer = self._open(table.schema)
+            self._writer.write_table(table)
+        self.rows_written += len(data)
+
+    def _open(self, schema):
+        if self.file_format == "parquet":
+            return pq.ParquetWriter(self.path, schema, compression=self.compression or "snappy")
+        compression = self.compression or "lz4"
+        options = pa.ipc.IpcWriteOptions(compression=None if compression == "uncompressed" else compression)
+        return pa.ipc.new_file(self.path, schema, options=options)
+
+    def close(self):
+        if self._writer is not None and self.file_format != "csv":
+            self._writer.close()
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,107 @@
+import os
+import json
+import logging
+import numpy as np
+
+FORMAT_VERSION = 1
+
+MANIFEST_NAME = "manifest.json"
+
+# Node arrays of all trees, concatenated. Leaves point to themselves with
+# feature 0 and threshold +inf, so a traversal can take max_depth steps
+# without checking for leaves.
+ARRAY_NAMES = ("roots", "feature", "threshold", "left", "right", "value")
+
+
+class ForestArrays:
+    """Tree arrays of a regression forest plus the manifest describing them."""
+
+    def __init__(self, manifest, arrays):
+        self.manifest = manifest
+        for name in ARRAY_NAMES:
+            setattr(self, name, arrays[name])
+
+    @property
+    def n_trees(self):
+        return self.manifest["n_trees"]
+
+    @property
+    def feature_names(self):
+        return self.manifest["feature_names"]
+
+    @property
+    def max_depth(self):
+        return self.manifest["max_depth"]
+
+
+def forest_to_arrays(model) -> ForestArrays:
+    """Flatten a fitted single-output RandomForestRegressor."""
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    if any(tree.n_outputs != 1 for tree in trees):
+        raise ValueError("Only single-output forests can be flattened")
+
+    sizes = np.array([tree.node_count for tree in trees], dtype=np.int64)
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int32)
+    n_nodes = int(sizes.sum())
+    if n_nodes >= np.iinfo(np.int32).max:
+        raise ValueError(f"Forest has {n_nodes} nodes, too many for int32 node indices")
+
+    feature = np.empty(n_nodes, dtype=np.int16)
+    threshold = np.empty(n_nodes, dtype=np.float64)
+    left = np.empty(n_nodes, dtype=np.int32)
+    right = np.empty(n_nodes, dtype=np.int32)
+    value = np.empty(n_nodes, dtype=np.float64)
+    for root, tree in zip(roots, trees):
+        nodes = slice(root, root + tree.node_count)
+        is_leaf = tree.children_left == -1
+        own_index = np.arange(root, root + tree.node_count, dtype=np.int32)
+        feature[nodes] = np.where(is_leaf, 0, tree.feature)
+        threshold[nodes] = np.where(is_leaf, np.inf, tree.threshold)
+        left[nodes] = np.where(is_leaf, own_index, tree.children_left + root)
+        right[nodes] = np.where(is_leaf, own_index, tree.children_right + root)
+        value[nodes] = tree.value[:, 0, 0]
+
+    feature_names = getattr(model, "feature_names_in_", None)
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "model_type": type(model).__name__,
+        "n_trees": len(trees),
+        "n_features": int(model.n_features_in_),
+        "feature_names": None if feature_names is None else [str(name) for name in feature_names],
+        "n_nodes": n_nodes,
+        "max_depth": int(max(tree.max_depth for tree in trees)),
+    }
+    arrays = {"roots": roots, "feature": feature, "threshold": threshold,
+              "left": left, "right": right, "value": value}
+    return ForestArrays(manifest, arrays)
+
+
+def save_forest_arrays(forest: ForestArrays, directory):
+    """Write each array as an uncompressed .npy file next to a JSON manifest."""
+    os.makedirs(directory, exist_ok=True)
+    manifest = dict(forest.manifest, arrays={})
+    for name in ARRAY_NAMES:
+        array = getattr(forest, name)
+        np.save(os.path.join(directory, f"{name}.npy"), array, allow_pickle=False)
+        manifest["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape)}
+    with open(os.path.join(directory, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=1)
+    logging.info(f"Saved {forest.n_trees} trees ({manifest['n_nodes']} nodes) as arrays to {directory}")
+
+
+def load_forest_arrays(directory, mmap=True) -> ForestArrays:
+    """Load arrays written by save_forest_arrays, memory-mapped by default. Nothing is unpickled."""
+    with open(os.path.join(directory, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest["format_version"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported forest array format {manifest['format_version']} in {directory}")
+
+    arrays = {}
+    for name in ARRAY_NAMES:
+        array = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None,
+                        allow_pickle=False)
+        expected = manifest["arrays"][name]
+        if array.dtype.str != expected["dtype"] or list(array.shape) != expected["shape"]:
+            raise ValueError(f"{name}.npy in {directory} does not match its manifest entry {expected}")
+        arrays[name] = array
+    return ForestArrays(manifest, arrays)
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+from common.forest_arrays import ForestArrays, forest_to_arrays, load_forest_arrays
+
+# Node indices traversed per step, as (trees x rows) blocks: small batches walk
+# all trees at once, large ones walk one tree over a cache-sized slice of rows.
+BLOCK_CELLS = 16_384
+
+class ForestEngine:
+    """Predicts with a flattened forest by walking all trees of a batch in lock step.
+
+    Mirrors sklearn: features are cast to float32 and compared against float64
+    thresholds (x <= threshold goes left), and per-tree leaf values are summed in
+    tree order before dividing by the number of trees, so the output equals
+    RandomForestRegressor.predict with n_jobs=1 bit for bit.
+    """
+
+    def __init__(self, forest: ForestArrays):
+        self.forest = forest
+        self.feature_names = forest.feature_names
+        self.n_features = forest.manifest["n_features"]
+        self.n_trees = forest.n_trees
+        self.max_depth = forest.max_depth
+        self.roots = np.asarray(forest.roots, dtype=np.intp)
+        self.feature = np.asarray(forest.feature, dtype=np.intp)
+        # Copied out of the memory map: gathers from private pages are noticeably faster.
+        self.threshold = np.array(forest.threshold)
+        self.value = np.array(forest.value)
+        # children[2 * node] is the left child, children[2 * node + 1] the right one.
+        self.children = np.stack([forest.left, forest.right], axis=1).astype(np.intp).ravel()
+
+    @classmethod
+    def from_model(cls, model):
+        return cls(forest_to_arrays(model))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        return cls(load_forest_arrays(directory, mmap=mmap))
+
+    def to_matrix(self, X) -> np.ndarray:
+        """Validate the columns and return a C-contiguous float32 feature matrix."""
+        if isinstance(X, pd.DataFrame):
+            if self.feature_names is not None and list(X.columns) != self.feature_names:
+                raise ValueError(f"Expected columns {self.feature_names}, got {list(X.columns)}")
+            X = X.to_numpy(dtype=np.float32)
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected a 2-d array with {self.n_features} columns, got shape {X.shape}")
+        if np.isnan(X).any():
+            raise ValueError("Input contains NaN")
+        return X
+
+    def leaves(self, X: np.ndarray, roots: np.ndarray) -> np.ndarray:
+        """Leaf node index reached from each root, shape (len(roots), rows)."""
+        flat = X.ravel()
+        row_offsets = np.tile(np.arange(len(X), dtype=np.intp) * self.n_features, len(roots))
+        nodes = np.repeat(roots, len(X))
+        for _ in range(self.max_depth):
+            go_right = ~(flat[row_offsets + self.feature[nodes]] <= self.threshold[nodes])
+            nodes = self.children[2 * nodes + go_right]
+        return nodes.reshape(len(roots), len(X))
+
+    def predict(self, X) -> np.ndarray:
+        X = self.to_matrix(X)
+        predictions = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), BLOCK_CELLS):
+            rows = X[start:start + BLOCK_CELLS]
+            total = np.zeros(len(rows), dtype=np.float64)
+            trees_per_block = max(1, BLOCK_CELLS // len(rows))
+            for first_tree in range(0, self.n_trees, trees_per_block):
+                roots = self.roots[first_tree:first_tree + trees_per_block]
+                for leaf_values in self.value[self.leaves(rows, roots)]:
+                    total += leaf_values
+            predictions[start:start + BLOCK_CELLS] = total / self.n_trees
+        return predictions
@@ -0,0 +1,114 @@
+import numpy as np
+
+
+class RegressionMetrics:
+    """Single-pass, mergeable accumulator for MAE, MSE, RMSE and R2.
+
+    Chunks can be accumulated in any order or in separate processes and
+    merged; the variance of the target needed for R2 is combined with Chan's
+    parallel update, so no second pass over the data is needed.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.abs_error = 0.0
+        self.squared_error = 0.0
+        self.target_mean = 0.0
+        self.target_m2 = 0.0
+
+    def update(self, y_true, y_pred):
+        y_true = np.asarray(y_true, dtype=np.float64)
+        error = np.asarray(y_pred, dtype=np.float64) - y_true
+        chunk = RegressionMetrics()
+        chunk.count = len(y_true)
+        if chunk.count:
+            chunk.abs_error = float(np.abs(error).sum())
+            chunk.squared_error = float(np.dot(error, error))
+            chunk.target_mean = float(y_true.mean())
+            centered = y_true - chunk.target_mean
+            chunk.target_m2 = float(np.dot(centered, centered))
+        return self.merge(chunk)
+
+    def merge(self, other):
+        count = self.count + other.count
+        if count == 0:
+            return self
+        delta = other.target_mean - self.target_mean
+        self.target_m2 += other.target_m2 + delta * delta * self.count * other.count / count
+        self.target_mean += delta * other.count / count
+        self.abs_error += other.abs_error
+        self.squared_error += other.squared_error
+        self.count = count
+        return self
+
+    def result(self):
+        if self.count == 0:
+            raise ValueError("No rows were scored")
+        mse = self.squared_error / self.count
+        # Same convention as sklearn's r2_score for a constant target
+        if self.target_m2 > 0:
+            r2 = 1 - self.squared_error / self.target_m2
+        else:
+            r2 = 1.0 if self.squared_error == 0 else 0.0
+        return {
+            "MAE": self.abs_error / self.count,
+            "MSE": mse,
+            "RMSE": float(np.sqrt(mse)),
+            "R2": r2,
+        }
+
+
+class SlicedMetrics:
+    """Per-group count, MAE, RMSE and R2 for slices given as non-negative integer group codes.
+
+    Each update is one np.bincount per statistic and slice. Chunks merge by
+    adding their per-group sums, so workers can accumulate independently.
+    """
+
+    def __init__(self):
+        self.sums = {}
+
+    def update(self, slice_codes, y_true, y_pred):
+        y_true = np.asarray(y_true, dtype=np.float64)
+        error = np.asarray(y_pred, dtype=np.float64) - y_true
+        weights = (None, np.abs(error), error * error, y_true, y_true * y_true)
+        for name, codes in slice_codes.items():
+            self.add(name, np.vstack([np.bincount(codes, weights=w) for w in weights]))
+        return self
+
+    def add(self, name, sums):
+        current = self.sums.get(name)
+        if current is None:
+            self.sums[name] = sums
+            return
+        if current.shape[1] < sums.shape[1]:
+            current, sums = sums, current
+        current[:, :sums.shape[1]] += sums
+        self.sums[name] = current
+
+    def merge(self, other):
+        for name, sums in other.sums.items():
+            self.add(name, sums.copy())
+        return self
+
+    def result(self, labels=None):
+        """{slice: {group label: {count, MAE, RMSE, R2}}} for non-empty groups; labels maps codes to names."""
+        report = {}
+        for name, (count, abs_error, squared_error, target_sum, target_squares) in self.sums.items():
+            names = (labels or {}).get(name)
+            groups = {}
+            for code in np.flatnonzero(count):
+                n = count[code]
+                target_m2 = target_squares[code] - target_sum[code] ** 2 / n
+                if target_m2 > 0:
+                    r2 = 1 - squared_error[code] / target_m2
+                else:
+                    r2 = 1.0 if squared_error[code] == 0 else 0.0
+                groups[names[code] if names else str(code)] = {
+                    "count": int(n),
+                    "MAE": float(abs_error[code] / n),
+                    "RMSE": float(np.sqrt(squared_error[code] / n)),
+                    "R2": float(r2),
+                }
+            report[name] = groups
+        return report
@@ -0,0 +1,21 @@
+from threadpoolctl import threadpool_limits
+
+
+def single_threaded(model):
+    """Make a model loaded in a process-pool worker predict on one thread.
+
+    The pool already runs one worker per core; a forest with its trained
+    n_jobs=-1 or a HistGradientBoosting model on all-core OpenMP in every
+    worker would put cores x cores threads on the host. Sets n_jobs=1 on the
+    model, unwrapping .predictor wrappers, and caps the process's OpenMP and
+    BLAS pools at one thread.
+    """
+    threadpool_limits(1)
+    predictor = model
+    while predictor is not None:
+        if hasattr(predictor, "get_params"):
+            # also reaches the n_jobs of estimators inside a Pipeline
+            n_jobs = [name for name in predictor.get_params() if name == "n_jobs" or name.endswith("__n_jobs")]
+            predictor.set_params(**{name: 1 for name in n_jobs})
+        predictor = getattr(predictor, "predictor", None)
+    return model
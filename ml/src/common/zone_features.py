@@ -0,0 +1,243 @@
+import os
+import json
+import logging
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+
+MANIFEST_NAME = "manifest.json"
+
+# Subdirectory of the processed data and of the model dir holding the store
+ZONE_FEATURES_DIR = "zone_features"
+
+# TLC LocationIDs run from 1 to 265, so arrays are indexed by the ID itself.
+# Index 0 holds the fallback used for IDs outside that range.
+N_ZONES = 266
+
+ZONE_COLUMNS = ("PULocationID", "DOLocationID")
+
+# Aggregates per pickup zone, per dropoff zone and per (pickup, dropoff) pair
+STATISTICS = ("median_fare", "median_distance", "trip_count")
+FEATURE_NAMES = tuple(f"{prefix}_{statistic}" for prefix in ("pu", "do", "pair") for statistic in STATISTICS)
+
+ARRAY_NAMES = ("pickup", "dropoff", "pair")
+
+# Subdirectory of the store holding the out-of-fold stores for the training
+# rows; it is not copied into the model dir.
+FOLDS_DIR = "folds"
+
+
+def zone_index(ids) -> np.ndarray:
+    """LocationIDs as array indices; unknown IDs map to the fallback index 0."""
+    ids = np.asarray(ids).astype(np.int64)
+    return np.where((ids > 0) & (ids < N_ZONES), ids, 0)
+
+
+def group_medians(keys, values, n_groups):
+    """Median of values and row count per integer key in [0, n_groups), NaN for empty groups."""
+    counts = np.bincount(keys, minlength=n_groups)
+    sorted_values = values[np.lexsort((values, keys))]
+    starts = np.cumsum(counts) - counts
+    present = counts > 0
+    lo = (starts + (counts - 1) // 2)[present]
+    hi = (starts + counts // 2)[present]
+    medians = np.full(n_groups, np.nan)
+    medians[present] = (sorted_values[lo] + sorted_values[hi]) / 2
+    return medians, counts
+
+
+class ZoneFeatures:
+    """Dense per-zone and per-zone-pair aggregates, looked up by array indexing.
+
+    pickup and dropoff are (N_ZONES, 3) and pair is (N_ZONES, N_ZONES, 3)
+    float32 arrays of median fare, median distance and trip count. Medians
+    of zones or pairs with fewer than min_count trips are filled from the
+    pickup zone or the whole training split, so every lookup is defined.
+    """
+
+    def __init__(self, manifest, arrays):
+        self.manifest = manifest
+        for name in ARRAY_NAMES:
+            setattr(self, name, arrays[name])
+        # One row of all features per (pickup, dropoff) pair, so a lookup is a single gather.
+        table = np.empty((N_ZONES, N_ZONES, len(FEATURE_NAMES)), dtype=np.float32)
+        table[:, :, 0:3] = self.pickup[:, None, :]
+        table[:, :, 3:6] = self.dropoff[None, :, :]
+        table[:, :, 6:9] = self.pair
+        self.table = table.reshape(N_ZONES * N_ZONES, len(FEATURE_NAMES))
+
+    @property
+    def feature_names(self):
+        return list(FEATURE_NAMES)
+
+    def lookup(self, pickup_ids, dropoff_ids) -> np.ndarray:
+        """(rows, len(FEATURE_NAMES)) float32 features of each trip."""
+        return self.table[zone_index(pickup_ids) * N_ZONES + zone_index(dropoff_ids)]
+
+    def apply(self, data: pd.DataFrame) -> pd.DataFrame:
+        """The frame with the zone features appended as columns after its own."""
+        features = self.lookup(data[ZONE_COLUMNS[0]], data[ZONE_COLUMNS[1]])
+        return data.assign(**{name: features[:, i] for i, name in enumerate(FEATURE_NAMES)})
+
+    def apply_matrix(self, X: np.ndarray, pickup_column, dropoff_column) -> np.ndarray:
+        """A float32 feature matrix with the zone features appended as columns."""
+        return np.hstack([X, self.lookup(X[:, pickup_column], X[:, dropoff_column])])
+
+
+def zone_folds(data: pd.DataFrame, n_folds) -> np.ndarray:
+    """Fold of each training row, from a hash of all its columns.
+
+    Preprocessing and training both hash the train split as written, so they
+    agree on the folds without storing them.
+    """
+    return (pd.util.hash_pandas_object(data, index=False).to_numpy() % np.uint64(n_folds)).astype(np.int64)
+
+
+class OutOfFoldZoneFeatures:
+    """Zone features of the training rows themselves, without their own fares.
+
+    A row in fold k gets the aggregates of the trips in the other folds, so
+    its fare never feeds its own median_fare features and the model sees
+    them as noisy as on unseen trips. Serving and evaluation use the full
+    ZoneFeatures store.
+    """
+
+    def __init__(self, folds):
+        self.folds = folds
+
+    @property
+    def feature_names(self):
+        return list(FEATURE_NAMES)
+
+    def apply(self, data: pd.DataFrame) -> pd.DataFrame:
+        """The frame of training rows, with the zone features of the folds they are not in appended."""
+        fold = zone_folds(data, len(self.folds))
+        pickup_ids = data[ZONE_COLUMNS[0]].to_numpy()
+        dropoff_ids = data[ZONE_COLUMNS[1]].to_numpy()
+        features = np.empty((len(data), len(FEATURE_NAMES)), dtype=np.float32)
+        for k, store in enumerate(self.folds):
+            rows = fold == k
+            features[rows] = store.lookup(pickup_ids[rows], dropoff_ids[rows])
+        return data.assign(**{name: features[:, i] for i, name in enumerate(FEATURE_NAMES)})
+
+
+class WithZoneFeatures:
+    """A model trained with zone features, fed frames of the raw trip features."""
+
+    def __init__(self, predictor, zone_features: ZoneFeatures):
+        self.predictor = predictor
+        self.zone_features = zone_features
+
+    def predict(self, X: pd.DataFrame) -> np.ndarray:
+        return self.predictor.predict(self.zone_features.apply(X))
+
+
+def with_zone_features(predictor, model_dir):
+    """Wrap a loaded model in WithZoneFeatures when its model dir has a zone feature store."""
+    directory = os.path.join(model_dir, ZONE_FEATURES_DIR)
+    if not os.path.isdir(directory):
+        return predictor
+    return WithZoneFeatures(predictor, load_zone_features(directory))
+
+
+def build_zone_features(pickup_ids, dropoff_ids, fare, distance, min_count=20, count_scale=1.0) -> ZoneFeatures:
+    """Aggregate training trips into a ZoneFeatures store.
+
+    Trip counts are multiplied by count_scale before they are stored and
+    compared with min_count, so a store built from a sample of the trips
+    counts on the scale of all of them.
+    """
+    pickup = zone_index(pickup_ids)
+    dropoff = zone_index(dropoff_ids)
+    fare = np.asarray(fare, dtype=np.float64)
+    distance = np.asarray(distance, dtype=np.float64)
+    global_medians = np.array([np.median(fare), np.median(distance)]) if len(fare) else np.zeros(2)
+
+    def aggregate(keys, n_groups, fallback):
+        fare_medians, counts = group_medians(keys, fare, n_groups)
+        distance_medians, _ = group_medians(keys, distance, n_groups)
+        counts = counts * count_scale
+        medians = np.column_stack([fare_medians, distance_medians])
+        sparse = counts < min_count
+        medians[sparse] = fallback[sparse]
+        return np.column_stack([medians, counts]).astype(np.float32)
+
+    zone_fallback = np.broadcast_to(global_medians, (N_ZONES, 2))
+    arrays = {
+        "pickup": aggregate(pickup, N_ZONES, zone_fallback),
+        "dropoff": aggregate(dropoff, N_ZONES, zone_fallback),
+    }
+    # Sparse pairs fall back to their pickup zone.
+    pair_fallback = np.repeat(arrays["pickup"][:, :2], N_ZONES, axis=0)
+    arrays["pair"] = aggregate(pickup * N_ZONES + dropoff, N_ZONES * N_ZONES,
+                               pair_fallback).reshape(N_ZONES, N_ZONES, len(STATISTICS))
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "n_zones": N_ZONES,
+        "feature_names": list(FEATURE_NAMES),
+        "rows": int(len(fare)),
+        "min_count": min_count,
+        "pairs_with_min_count": int((arrays["pair"][:, :, 2] >= min_count).sum()),
+    }
+    return ZoneFeatures(manifest, arrays)
+
+
+def build_out_of_fold_zone_features(data: pd.DataFrame, target, n_folds=5, min_count=20) -> OutOfFoldZoneFeatures:
+    """One store per fold of the training rows, each aggregating the trips of the other folds."""
+    fold = zone_folds(data, n_folds)
+    columns = [data[ZONE_COLUMNS[0]].to_numpy(), data[ZONE_COLUMNS[1]].to_numpy(),
+               data[target].to_numpy(), data["trip_distance"].to_numpy()]
+    # Counts from the other n_folds - 1 folds, scaled to match the full store's
+    return OutOfFoldZoneFeatures([
+        build_zone_features(*(column[fold != k] for column in columns), min_count=min_count,
+                            count_scale=n_folds / (n_folds - 1))
+        for k in range(n_folds)
+    ])
+
+
+def save_zone_features(zone_features: ZoneFeatures, directory):
+    """Write each array as an uncompressed .npy file next to a JSON manifest."""
+    os.makedirs(directory, exist_ok=True)
+    manifest = dict(zone_features.manifest, arrays={})
+    for name in ARRAY_NAMES:
+        array = getattr(zone_features, name)
+        np.save(os.path.join(directory, f"{name}.npy"), array, allow_pickle=False)
+        manifest["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape)}
+    with open(os.path.join(directory, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=1)
+    logging.info(f"Saved zone features of {manifest['rows']} trips "
+                 f"({manifest['pairs_with_min_count']} zone pairs with enough trips) to {directory}")
+
+
+def save_out_of_fold_zone_features(zone_features: OutOfFoldZoneFeatures, directory):
+    """Write each fold's store to FOLDS_DIR/fold_<k> under the full store's directory."""
+    for k, store in enumerate(zone_features.folds):
+        save_zone_features(store, os.path.join(directory, FOLDS_DIR, f"fold_{k}"))
+
+
+def load_out_of_fold_zone_features(directory):
+    """Stores written by save_out_of_fold_zone_features, or None if the store has none."""
+    folds_dir = os.path.join(directory, FOLDS_DIR)
+    if not os.path.isdir(folds_dir):
+        return None
+    n_folds = len([name for name in os.listdir(folds_dir) if name.startswith("fold_")])
+    return OutOfFoldZoneFeatures([load_zone_features(os.path.join(folds_dir, f"fold_{k}")) for k in range(n_folds)])
+
+
+def load_zone_features(directory) -> ZoneFeatures:
+    """Load arrays written by save_zone_features. Nothing is unpickled."""
+    with open(os.path.join(directory, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest["format_version"] != FORMAT_VERSION or manifest["feature_names"] != list(FEATURE_NAMES):
+        raise ValueError(f"Unsupported zone feature store in {directory}")
+
+    arrays = {}
+    for name in ARRAY_NAMES:
+        array = np.load(os.path.join(directory, f"{name}.npy"), allow_pickle=False)
+        expected = manifest["arrays"][name]
+        if array.dtype.str != expected["dtype"] or list(array.shape) != expected["shape"]:
+            raise ValueError(f"{name}.npy in {directory} does not match its manifest entry {expected}")
+        arrays[name] = array
+    return ZoneFeatures(manifest, arrays)
@@ -1,11 +1,22 @@
 import json
 import os
+import sys
+import time
 import argparse
 import joblib
+import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
 import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.dataset_io import FORMATS, dataset_num_rows, iter_dataset_batches
+from common.forest_engine import ForestEngine
+from common.metrics import RegressionMetrics, SlicedMetrics
+from common.worker_threads import single_threaded
+from common.zone_features import with_zone_features
 
 logging.basicConfig(
     level=logging.INFO,
@@ -34,72 +45,241 @@ def parse_args():
 
     parser.add_argument("--train_file_name", required=True)
     parser.add_argument("--test_file_name", required=True)
+    parser.add_argument("--data_format", choices=FORMATS, default=None,
+                        help="Format of the train/test files; inferred from their extension by default")
     parser.add_argument("--model_name", required=True)
+    parser.add_argument("--student_dir", default=None,
+                        help="Distilled student model directory or model.tar.gz; it is evaluated into its own report too")
+    parser.add_argument("--forest_arrays_dir", default="forest")
+    parser.add_argument("--predictor", choices=["auto", "sklearn", "arrays"], default="auto",
+                        help="auto uses the flat forest arrays when the model directory has them; "
+                             "sklearn needs a model.pkl, which forests are not saved with")
     parser.add_argument("--output_name", default="evaluation.json")
+    parser.add_argument("--student_output_name", default="student_evaluation.json")
     parser.add_argument("--target", default="fare_amount")
+    parser.add_argument("--batch_rows", type=int, default=1_000_000,
+                        help="Rows per scoring chunk sent to a worker")
+    parser.add_argument("--n_workers", type=int, default=os.cpu_count())
+    parser.add_argument("--train_sample_rows", type=int, default=0,
+                        help="Score a fixed-size random sample of train instead of all of it; 0 scores everything")
+    parser.add_argument("--random_state", type=int, default=58)
+    parser.add_argument("--slice_min_count", type=int, default=100,
+                        help="Smallest test slice considered when reporting the worst slice per column")
     parser.add_argument("--is_local", type=bool, default=False)
     
     return parser.parse_args()
 
-logging.info("Parsing args")
-args = parse_args()
+# Test metrics are also reported per value of these columns and per trip_distance bucket (miles)
+SLICE_COLUMNS = ["PULocationID", "DOLocationID", "payment_type"]
+DISTANCE_BUCKET_EDGES = [1, 2, 3, 5, 10, 20, 50]
+DISTANCE_BUCKET_LABELS = ["0-1", "1-2", "2-3", "3-5", "5-10", "10-20", "20-50", "50+"]
 
-def evaluate(model: RandomForestRegressor, val_df:pd.DataFrame):
-    logging.info("Validating...")
-    X_val = val_df.drop(args.target, axis=1)
-    y_val = val_df[args.target]
-    logging.info("split data....")
-    preds = model.predict(X_val)
-    logging.info("making prediction data....")
-    val_scores = {
-    "MAE":mean_absolute_error(y_val, preds),
-    "MSE":mean_squared_error(y_val, preds),
-    "RMSE":mean_squared_error(y_val, preds, squared=False),
-    "R2":r2_score(y_val, preds)
-    }
-    logging.info(f"Done evaluation :\n{val_scores}....")
-    
-    return val_scores
+args = None
+# Model of each worker process, loaded once by init_worker.
+_model = None
 
-def main():
-    score = {}
+def load_model(model_dir, model_name, forest_arrays_dir, predictor="auto"):
+    forest_dir = os.path.join(model_dir, forest_arrays_dir)
+    if predictor == "arrays" or (predictor == "auto" and os.path.isdir(forest_dir)):
+        model = ForestEngine.load(forest_dir)
+    else:
+        # Load model.pkl (now exists after extraction)
+        model = joblib.load(os.path.join(model_dir, model_name))
+    return with_zone_features(model, model_dir)
 
-    # model_path = os.path.join(args.model_dir, args.model_name)
-    # model = joblib.load(model_path)
-        # Extract model.tar.gz (SageMaker TrainingJob format)
-    model_tar_path = os.path.join(args.model_dir, 'model.tar.gz')
-    model_path = os.path.join(args.model_dir, args.model_name)
-    
+def extract_model_archive(model_dir):
+    """Extract model.tar.gz (SageMaker TrainingJob format) in place, if the directory has one."""
+    model_tar_path = os.path.join(model_dir, 'model.tar.gz')
     if os.path.exists(model_tar_path):
         import tarfile
         with tarfile.open(model_tar_path, 'r:gz') as tar:
-            tar.extractall(args.model_dir)
-        logging.info(f"Extracted model.tar.gz to {args.model_dir}")
-    
-    logging.info("Model is being loaded...")
-    # Load model.pkl (now exists after extraction)
-    model = joblib.load(model_path)
-    logging.info("Model is loaded!")
+            tar.extractall(model_dir)
+        logging.info(f"Extracted model.tar.gz to {model_dir}")
 
-    train_file = os.path.join(args.data_dir, args.train_file_name)
-    train_df = pd.read_csv(train_file)
+def open_pool(model_args):
+    """Load the model in this process and, with n_workers > 1, in a pool of workers (None otherwise)."""
+    init_worker(*model_args)
+    logging.info(f"Model is loaded! ({type(_model).__name__})")
+    if args.n_workers > 1:
+        return ProcessPoolExecutor(args.n_workers, initializer=init_pool_worker, initargs=model_args)
+    return None
 
-    test_file = os.path.join(args.data_dir, args.test_file_name)
-    test_df = pd.read_csv(test_file)
+def init_worker(*model_args):
+    global _model
+    _model = load_model(*model_args)
 
-    logging.info(f"Evaluating training data...")
-    score["train_score"] = evaluate(model, train_df)
+def model_label(model):
+    """Name of the model type in the evaluation report: forest, hist_gbm or the class name."""
+    while hasattr(model, "predictor"):
+        model = model.predictor
+    if hasattr(model, "steps"):
+        model = model.steps[-1][1]
+    if isinstance(model, (ForestEngine, RandomForestRegressor)):
+        return "forest"
+    if isinstance(model, HistGradientBoostingRegressor):
+        return "hist_gbm"
+    return type(model).__name__
 
-    logging.info(f"Evaluating testing data...")
-    score["test_score"] = evaluate(model, test_df)
+def init_pool_worker(*model_args):
+    # The pool is the parallelism; a multithreaded model in every worker would oversubscribe the cores.
+    init_worker(*model_args)
+    single_threaded(_model)
 
-    os.makedirs(args.output_dir, exist_ok=True)
-    path_output = os.path.join(args.output_dir, args.output_name)
-    
+def slice_codes(val_df:pd.DataFrame):
+    codes = {column: np.asarray(val_df[column], dtype=np.int64) for column in SLICE_COLUMNS}
+    codes["trip_distance"] = np.digitize(val_df["trip_distance"], DISTANCE_BUCKET_EDGES)
+    return codes
+
+def evaluate(model, val_df:pd.DataFrame, target, with_slices=False):
+    """Score a fitted forest, hist_gbm pipeline or ForestEngine on one chunk; all expose predict on the raw feature frame.
+
+    Returns the chunk's metrics, its per-slice metrics (None unless with_slices), the predict time and the row count.
+    """
+    X_val = val_df.drop(columns=target)
+    start = time.perf_counter()
+    preds = model.predict(X_val)
+    seconds = time.perf_counter() - start
+    metrics = RegressionMetrics().update(val_df[target], preds)
+    sliced = SlicedMetrics().update(slice_codes(val_df), val_df[target], preds) if with_slices else None
+    return metrics, sliced, seconds, len(val_df)
+
+def evaluate_chunk(val_df:pd.DataFrame, target, with_slices=False):
+    return evaluate(_model, val_df, target, with_slices)
+
+def iter_chunks(path, batch_rows, sample_rows=0, random_state=None):
+    """Chunks of a dataset, or of a fixed-size uniform sample of its rows, in file order."""
+    if not sample_rows:
+        yield from iter_dataset_batches(path, batch_rows, args.data_format)
+        return
+    n_rows = dataset_num_rows(path, args.data_format)
+    if sample_rows >= n_rows:
+        yield from iter_dataset_batches(path, batch_rows, args.data_format)
+        return
+    positions = np.sort(np.random.default_rng(random_state).choice(n_rows, sample_rows, replace=False))
+    logging.info(f"Sampling {sample_rows} of {n_rows} rows from {path}")
+    offset = 0
+    for chunk in iter_dataset_batches(path, batch_rows, args.data_format):
+        lo, hi = np.searchsorted(positions, [offset, offset + len(chunk)])
+        if hi > lo:
+            yield chunk.iloc[positions[lo:hi] - offset]
+        offset += len(chunk)
+
+def latency_summary(batch_seconds, rows):
+    batch_ms = np.array(batch_seconds) * 1000
+    return {
+        "batches": len(batch_ms),
+        "rows": rows,
+        "p50_ms": float(np.percentile(batch_ms, 50)),
+        "p99_ms": float(np.percentile(batch_ms, 99)),
+        "max_ms": float(batch_ms.max()),
+        "rows_per_second": rows / max(batch_ms.sum() / 1000, 1e-9),
+    }
+
+def worst_slices(slices, min_count):
+    """Highest-RMSE group of each slice column among groups with at least min_count rows."""
+    worst = {}
+    for name, groups in slices.items():
+        candidates = {group: scores for group, scores in groups.items() if scores["count"] >= min_count}
+        if candidates:
+            group = max(candidates, key=lambda g: candidates[g]["RMSE"])
+            worst[name] = {"group": group, **candidates[group]}
+    return worst
+
+def evaluate_dataset(path, pool, sample_rows=0, with_slices=False):
+    """Stream a dataset through the pool (or this process) and merge the per-chunk results.
+
+    Returns the metrics, the SlicedMetrics (None unless with_slices) and a summary of per-batch predict latency.
+    """
+    start = time.perf_counter()
+    metrics = RegressionMetrics()
+    sliced = SlicedMetrics() if with_slices else None
+    batch_seconds = []
+
+    def merge(result):
+        chunk_metrics, chunk_sliced, seconds, _ = result
+        metrics.merge(chunk_metrics)
+        if with_slices:
+            sliced.merge(chunk_sliced)
+        batch_seconds.append(seconds)
+
+    chunks = iter_chunks(path, args.batch_rows, sample_rows, args.random_state)
+    if pool is None:
+        for chunk in chunks:
+            merge(evaluate_chunk(chunk, args.target, with_slices))
+    else:
+        # Keep a few chunks per worker in flight so reading overlaps scoring without holding the whole file.
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(evaluate_chunk, chunk, args.target, with_slices))
+            if len(pending) >= 2 * args.n_workers:
+                merge(pending.popleft().result())
+        while pending:
+            merge(pending.popleft().result())
+    scores = metrics.result()
+    logging.info(f"Done evaluation of {metrics.count} rows in {time.perf_counter() - start:.1f}s:\n{scores}")
+    return scores, sliced, latency_summary(batch_seconds, metrics.count)
+
+def evaluate_model(model_dir):
+    """Model type, train and test scores, test slices and predict latency of the model in model_dir."""
+    score = {}
+    extract_model_archive(model_dir)
+
+    logging.info(f"Model in {model_dir} is being loaded...")
+    pool = open_pool((model_dir, args.model_name, args.forest_arrays_dir, args.predictor))
+    score["model"] = model_label(_model)
+    try:
+        train_file = os.path.join(args.data_dir, args.train_file_name)
+        logging.info(f"Evaluating training data...")
+        score["train_score"], _, train_latency = evaluate_dataset(train_file, pool, args.train_sample_rows)
+
+        test_file = os.path.join(args.data_dir, args.test_file_name)
+        logging.info(f"Evaluating testing data...")
+        score["test_score"], test_sliced, test_latency = evaluate_dataset(test_file, pool, with_slices=True)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # Slices sit next to the global scores so the RMSECheck condition and the
+    # notification lambda can read them from evaluation.json.
+    score["test_slices"] = test_sliced.result(labels={"trip_distance": DISTANCE_BUCKET_LABELS})
+    score["test_worst_slices"] = worst_slices(score["test_slices"], args.slice_min_count)
+    score["test_worst_slice_RMSE"] = max((worst["RMSE"] for worst in score["test_worst_slices"].values()),
+                                         default=score["test_score"]["RMSE"])
+    score["latency"] = {"train": train_latency, "test": test_latency}
+    return score
+
+
+def write_report(score, name):
+    path_output = os.path.join(args.output_dir, name)
     logging.info(f"Writting output to json...")
     with open(path_output, "w") as f:
         json.dump(score, f)
-    logging.info(f"Output is written to json...")
+    logging.info(f"Output is written to {path_output}")
+
+
+def main():
+    # model_path = os.path.join(args.model_dir, args.model_name)
+    # model = joblib.load(model_path)
+    score = evaluate_model(args.model_dir)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    if args.student_dir:
+        # The student gets a report of its own, registered as the model statistics of its package.
+        student_score = evaluate_model(args.student_dir)
+        student_score["model"] = f"distilled {student_score['model']}"
+        score["student_model"] = student_score["model"]
+        student_score["teacher_model"] = score["model"]
+        # RegisterModel serves the student instead of the forest when this stays within the error budget.
+        score["student_test_score"] = student_score["test_score"]
+        score["student_RMSE_delta"] = student_score["test_score"]["RMSE"] - score["test_score"]["RMSE"]
+        score["latency"]["student_test"] = student_score["latency"]["test"]
+        student_score["teacher_test_score"] = score["test_score"]
+        student_score["student_RMSE_delta"] = score["student_RMSE_delta"]
+        write_report(student_score, args.student_output_name)
+
+    write_report(score, args.output_name)
 
 if __name__ == "__main__":
+    logging.info("Parsing args")
+    args = parse_args()
     main()
\ No newline at end of file
@@ -0,0 +1,177 @@
+"""Offline scoring of parquet trip files, locally or as a processing step.
+
+Each input file gets a <name>_predictions.parquet next to it (or in
+--output_dir) with the row number in the input file, the prediction and, when
+the input has it, the actual fare.
+
+    python ml/src/inference/batch_score.py --input_file_path data/2024 --model_dir model
+"""
+import os
+import sys
+import time
+import tarfile
+import argparse
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, ".."))
+# load_data.py sits in ../preprocessing locally and in ./preprocessing when shipped as a processing job dependency.
+sys.path.extend(os.path.join(root, "preprocessing") for root in (os.path.join(HERE, ".."), HERE))
+from load_data import KEPT_COLUMNS, passenger_count_mode, prepare_features, resolve_input_files
+from inference import load_model
+from common.worker_threads import single_threaded
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Model of each worker process, loaded once by init_worker.
+_model = None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_file_path", default="/opt/ml/processing/input",
+                        help="A parquet file, a directory of parquet files, or a glob pattern")
+    parser.add_argument("--model_dir", default="/opt/ml/processing/model")
+    parser.add_argument("--output_dir", default=None, help="Where to write predictions; next to each input by default")
+    parser.add_argument("--output_suffix", default="_predictions")
+    parser.add_argument("--target", default="fare_amount")
+    parser.add_argument("--batch_size", type=int, default=1_000_000,
+                        help="Rows per scoring task; row groups are never split")
+    parser.add_argument("--n_workers", type=int, default=os.cpu_count())
+    parser.add_argument("--passenger_fill", type=float, default=None,
+                        help="Fill for missing passenger_count; the mode over the inputs by default")
+    return parser.parse_args()
+
+
+def init_worker(model_dir):
+    global _model
+    _model = load_model(model_dir)
+
+
+def init_pool_worker(model_dir):
+    # The pool is the parallelism; a multithreaded model in every worker would oversubscribe the cores.
+    init_worker(model_dir)
+    single_threaded(_model)
+
+
+def output_path(input_path, output_dir, suffix):
+    name = os.path.splitext(os.path.basename(input_path))[0] + suffix + ".parquet"
+    return os.path.join(output_dir or os.path.dirname(input_path), name)
+
+
+def scoring_tasks(input_path, batch_size):
+    """(path, row groups, first row) covering the file in runs of about batch_size rows."""
+    metadata = pq.ParquetFile(input_path).metadata
+    tasks, row_groups, rows, first_row = [], [], 0, 0
+    for index in range(metadata.num_row_groups):
+        row_groups.append(index)
+        rows += metadata.row_group(index).num_rows
+        if rows >= batch_size:
+            tasks.append((input_path, row_groups, first_row))
+            row_groups, first_row, rows = [], first_row + rows, 0
+    if row_groups:
+        tasks.append((input_path, row_groups, first_row))
+    return tasks
+
+
+def score_row_groups(input_path, row_groups, first_row, passenger_fill, target):
+    """Score some row groups of one file; rows whose features are still missing after preprocessing get NaN."""
+    parquet_file = pq.ParquetFile(input_path)
+    columns = [column for column in KEPT_COLUMNS if column in parquet_file.schema_arrow.names]
+    data = prepare_features(parquet_file.read_row_groups(row_groups, columns=columns).to_pandas(), passenger_fill)
+
+    X = np.column_stack([data[name].to_numpy(dtype=np.float32, na_value=np.nan) for name in _model.feature_names])
+    valid = ~np.isnan(X).any(axis=1)
+    predictions = np.full(len(X), np.nan)
+    if valid.any():
+        predictions[valid] = _model.predict(X[valid])
+
+    result = {
+        "row_number": np.arange(first_row, first_row + len(X), dtype=np.int64),
+        "prediction": predictions,
+    }
+    if target in data.columns:
+        result[target] = data[target].to_numpy(dtype=np.float64, na_value=np.nan)
+    return result
+
+
+def iter_scored_tasks(tasks, model_dir, passenger_fill, target, n_workers):
+    """Yield (task, result) in task order, keeping up to 2 * n_workers tasks in flight in a process pool."""
+    if n_workers <= 1 or len(tasks) <= 1:
+        init_worker(model_dir)
+        for task in tasks:
+            yield task, score_row_groups(*task, passenger_fill, target)
+        return
+
+    with ProcessPoolExecutor(min(n_workers, len(tasks)), initializer=init_pool_worker, initargs=(model_dir,)) as pool:
+        pending = deque()
+        next_tasks = iter(tasks)
+        for task in next_tasks:
+            pending.append((task, pool.submit(score_row_groups, *task, passenger_fill, target)))
+            if len(pending) >= 2 * n_workers:
+                break
+        while pending:
+            task, future = pending.popleft()
+            next_task = next(next_tasks, None)
+            if next_task is not None:
+                pending.append((next_task, pool.submit(score_row_groups, *next_task, passenger_fill, target)))
+            yield task, future.result()
+
+
+def extract_model(model_dir):
+    model_tar_path = os.path.join(model_dir, "model.tar.gz")
+    if os.path.exists(model_tar_path):
+        with tarfile.open(model_tar_path, "r:gz") as tar:
+            tar.extractall(model_dir)
+        logging.info(f"Extracted model.tar.gz to {model_dir}")
+
+
+def main():
+    args = parse_args()
+    start = time.perf_counter()
+    input_paths = [path for path in resolve_input_files(args.input_file_path)
+                   if not path.endswith(args.output_suffix + ".parquet")]
+    extract_model(args.model_dir)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    passenger_fill = args.passenger_fill
+    if passenger_fill is None:
+        passenger_fill = passenger_count_mode(input_paths, args.batch_size, n_workers=args.n_workers)
+    logging.info(f"Filling missing passenger_count with {passenger_fill}")
+
+    tasks = [task for input_path in input_paths for task in scoring_tasks(input_path, args.batch_size)]
+    logging.info(f"Scoring {len(input_paths)} files in {len(tasks)} tasks with {args.n_workers} workers")
+
+    writer, writer_input, rows = None, None, 0
+    try:
+        for (input_path, _, _), result in iter_scored_tasks(tasks, args.model_dir, passenger_fill, args.target,
+                                                             args.n_workers):
+            table = pa.table(result)
+            if input_path != writer_input:
+                if writer is not None:
+                    writer.close()
+                path = output_path(input_path, args.output_dir, args.output_suffix)
+                writer, writer_input = pq.ParquetWriter(path, table.schema), input_path
+                logging.info(f"Writing predictions for {input_path} to {path}")
+            writer.write_table(table)
+            rows += len(result["prediction"])
+    finally:
+        if writer is not None:
+            writer.close()
+
+    seconds = time.perf_counter() - start
+    logging.info(f"Scored rows={rows} seconds={seconds:.1f} rows_per_second={rows / seconds:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import numpy as np
+
+
+class MicroBatcher:
+    """Coalesces concurrent predict calls into one call of `predict` per micro-batch.
+
+    A batch is closed when it holds max_batch_size rows or max_wait_ms after its
+    first request arrived, whichever comes first. Each caller gets back the rows
+    of the combined prediction that belong to its own request.
+    """
+
+    def __init__(self, predict, max_batch_size=256, max_wait_ms=2.0):
+        self.predict_batch = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.requests = 0
+        self.worker = None
+
+    def start(self):
+        if self.worker is None:
+            self.worker = asyncio.get_running_loop().create_task(self.run())
+
+    async def predict(self, X: np.ndarray) -> np.ndarray:
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((X, future))
+        return await future
+
+    async def next_batch(self):
+        pending = [await self.queue.get()]
+        rows = len(pending[0][0])
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while rows < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            if self.queue.empty():
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self.queue.get_nowait()
+            pending.append(item)
+            rows += len(item[0])
+        return pending
+
+    async def run(self):
+        while True:
+            pending = await self.next_batch()
+            try:
+                predictions = self.predict_batch(np.concatenate([X for X, _ in pending]))
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            start = 0
+            for X, future in pending:
+                if not future.done():
+                    future.set_result(predictions[start:start + len(X)])
+                start += len(X)
+            self.batches += 1
+            self.requests += len(pending)
+            if self.batches % 1000 == 0:
+                logging.info(f"Micro-batching: {self.requests} requests in {self.batches} batches "
+                             f"({self.requests / self.batches:.1f} per batch)")
@@ -0,0 +1,111 @@
+import logging
+import numpy as np
+from common.data_profile import PREDICTION_COLUMN
+
+# Smoothing for empty bins in the PSI, as a share of the window
+PSI_EPSILON = 1e-4
+
+
+def reference_bins(sketch, n_bins):
+    """Bin edges at the training quantiles and the training share of each bin.
+
+    Edges are upper bounds of the sketch buckets holding the quantiles, so the
+    reference counts are exact and a discrete value (a passenger count, a
+    zone) always falls in the same bin as its training rows. Repeated
+    quantiles of discrete columns collapse into fewer bins.
+    """
+    quantiles = np.linspace(0, 1, n_bins + 1)[1:-1]
+    edges = np.unique(sketch.bucket_upper_bounds(sketch.quantiles(quantiles)))
+    counts = sketch.histogram(edges)
+    return edges, counts / max(counts.sum(), 1)
+
+
+def psi(reference, live):
+    reference = np.maximum(reference, PSI_EPSILON)
+    live = np.maximum(live, PSI_EPSILON)
+    return float(np.sum((live - reference) * np.log(live / reference)))
+
+
+def binned_ks(reference, live):
+    """Largest gap between the two cumulative distributions at the bin edges."""
+    return float(np.max(np.abs(np.cumsum(live) - np.cumsum(reference))))
+
+
+class DriftMonitor:
+    """Fixed-memory histograms of request features and predictions, scored against the training profile.
+
+    A request only copies its rows into a preallocated column-major buffer.
+    Every buffer_rows rows the buffer is binned, one vectorised searchsorted
+    per column, into histograms over the training quantile bins. These decay
+    with a half-life of half_life_rows rows so the scores follow recent
+    traffic. PSI and binned KS per column are computed when metrics are read
+    or logged, not per request.
+    """
+
+    def __init__(self, profile, feature_names, n_bins=10, buffer_rows=4096,
+                 half_life_rows=100_000, log_every=100_000):
+        # Predictions are compared with the model's own predictions on training rows, not with the target,
+        # whose distribution is wider than any model's.
+        self.columns = list(feature_names) + [PREDICTION_COLUMN]
+        missing = [name for name in self.columns if name not in profile["columns"]]
+        if missing:
+            raise ValueError(f"Training profile has no columns {missing}")
+        bins = [reference_bins(profile["columns"][name]["sketch"], n_bins) for name in self.columns]
+        self.edges = [edges for edges, _ in bins]
+        self.reference = [reference for _, reference in bins]
+        self.counts = [np.zeros(len(edges) + 1) for edges in self.edges]
+        self.buffer = np.empty((len(self.columns), buffer_rows), dtype=np.float64)
+        self.buffered = 0
+        self.decay = 0.5 ** (buffer_rows / half_life_rows)
+        self.log_every = log_every
+        self.rows = 0
+        self._next_log = log_every
+
+    def update(self, X: np.ndarray, predictions: np.ndarray):
+        """Record a request's feature rows and predictions."""
+        n = len(X)
+        end = self.buffered + n
+        if end < self.buffer.shape[1]:
+            self.buffer[:-1, self.buffered:end] = X.T
+            self.buffer[-1, self.buffered:end] = predictions
+            self.buffered = end
+            return
+        start = 0
+        while start < n:
+            take = min(n - start, self.buffer.shape[1] - self.buffered)
+            self.buffer[:-1, self.buffered:self.buffered + take] = X[start:start + take].T
+            self.buffer[-1, self.buffered:self.buffered + take] = predictions[start:start + take]
+            self.buffered += take
+            start += take
+            if self.buffered == self.buffer.shape[1]:
+                self.flush()
+
+    def flush(self):
+        """Bin the buffered rows into the histograms."""
+        for values, edges, counts in zip(self.buffer[:, :self.buffered], self.edges, self.counts):
+            counts *= self.decay
+            counts += np.bincount(np.searchsorted(edges, values, side="left"), minlength=len(edges) + 1)
+        self.rows += self.buffered
+        self.buffered = 0
+        if self.rows >= self._next_log:
+            self._next_log = self.rows + self.log_every
+            logging.info(f"Drift after {self.rows} rows: {self.metrics()}")
+
+    def scores(self):
+        scores = {}
+        for name, reference, counts in zip(self.columns, self.reference, self.counts):
+            if counts.sum() > 0:
+                live = counts / counts.sum()
+                scores[name] = {"psi": psi(reference, live), "ks": binned_ks(reference, live)}
+        return scores
+
+    def metrics(self):
+        scores = self.scores()
+        worst = max(scores, key=lambda name: scores[name]["psi"], default=None)
+        return {
+            "rows": self.rows + self.buffered,
+            "scored_rows": self.rows,
+            "max_psi": None if worst is None else scores[worst]["psi"],
+            "max_psi_column": worst,
+            "columns": scores,
+        }
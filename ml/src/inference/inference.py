@@ -0,0 +1,255 @@
+import io
+import os
+import hashlib
+import sys
+import json
+import logging
+import joblib
+import numpy as np
+from numpy.lib import recfunctions
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.data_profile import PREDICTION_COLUMN, PROFILE_NAME, load_profile
+from common.forest_engine import ForestEngine
+from common.zone_features import ZONE_COLUMNS, ZONE_FEATURES_DIR, load_zone_features
+from prediction_cache import PredictionCache, parse_quantization
+from drift import DriftMonitor
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+MODEL_NAME = os.environ.get("MODEL_NAME", "model.pkl")
+FOREST_ARRAYS_DIR = os.environ.get("FOREST_ARRAYS_DIR", "forest")
+
+# Optional per-worker prediction cache, e.g. PREDICTION_CACHE_QUANTIZE="trip_distance=0.1".
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", "0"))
+PREDICTION_CACHE_TTL = float(os.environ["PREDICTION_CACHE_TTL"]) if os.environ.get("PREDICTION_CACHE_TTL") else None
+PREDICTION_CACHE_QUANTIZE = os.environ.get("PREDICTION_CACHE_QUANTIZE", "")
+
+# Drift of requests and predictions against the training profile saved with the model; DRIFT_BINS=0 disables it.
+DRIFT_BINS = int(os.environ.get("DRIFT_BINS", "10"))
+DRIFT_HALF_LIFE_ROWS = int(os.environ.get("DRIFT_HALF_LIFE_ROWS", "100000"))
+
+CSV_CONTENT_TYPE = "text/csv"
+JSON_CONTENT_TYPE = "application/json"
+NPY_CONTENT_TYPE = "application/x-npy"
+CONTENT_TYPES = (CSV_CONTENT_TYPE, JSON_CONTENT_TYPE, NPY_CONTENT_TYPE)
+
+# Loaded models by directory; SageMaker calls model_fn once per worker, the local server may call it more often.
+_models = {}
+_cache = None
+_drift = None
+
+
+class FareModel:
+    """A loaded model with the feature order it was trained on; predict takes a float32 matrix in that order.
+
+    With a zone feature store, feature_names are the request features only;
+    the store's features are appended by array lookup before predicting.
+    """
+
+    def __init__(self, predictor, feature_names, version=None, zone_features=None):
+        self.predictor = predictor
+        self.model_feature_names = list(feature_names)
+        self.zone_features = zone_features
+        self.feature_names = self.model_feature_names
+        if zone_features is not None:
+            self.feature_names = [name for name in self.model_feature_names
+                                  if name not in zone_features.feature_names]
+            if self.feature_names + zone_features.feature_names != self.model_feature_names:
+                raise ValueError(f"Model features {self.model_feature_names} do not end with the zone features")
+            self.zone_columns = [self.feature_names.index(name) for name in ZONE_COLUMNS]
+        self.version = version
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        if self.zone_features is not None:
+            X = self.zone_features.apply_matrix(X, *self.zone_columns)
+        if isinstance(self.predictor, ForestEngine):
+            return self.predictor.predict(X)
+        # Pickled pipelines select columns by name, so they need a frame.
+        import pandas as pd
+        return self.predictor.predict(pd.DataFrame(X, columns=self.model_feature_names))
+
+
+def artifact_version(paths):
+    """Short content hash of the model files, used to invalidate cached predictions."""
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def load_model(model_dir) -> FareModel:
+    zone_features = None
+    zone_paths = []
+    zone_dir = os.path.join(model_dir, ZONE_FEATURES_DIR)
+    if os.path.isdir(zone_dir):
+        zone_features = load_zone_features(zone_dir)
+        zone_paths = [os.path.join(zone_dir, name) for name in os.listdir(zone_dir)]
+
+    forest_dir = os.path.join(model_dir, FOREST_ARRAYS_DIR)
+    if os.path.isdir(forest_dir):
+        engine = ForestEngine.load(forest_dir)
+        version = artifact_version([os.path.join(forest_dir, name) for name in os.listdir(forest_dir)] + zone_paths)
+        model = FareModel(engine, engine.feature_names, version, zone_features)
+    else:
+        model_path = os.path.join(model_dir, MODEL_NAME)
+        predictor = joblib.load(model_path)
+        model = FareModel(predictor, predictor.feature_names_in_, artifact_version([model_path] + zone_paths),
+                          zone_features)
+    logging.info(f"Loaded {type(model.predictor).__name__} version {model.version} from {model_dir} "
+                 f"with features {model.feature_names}")
+    return model
+
+
+def configure_cache(model, max_entries, ttl_seconds=None, quantize=""):
+    """Enable (max_entries > 0) or disable the worker's prediction cache."""
+    global _cache
+    _cache = None
+    if max_entries > 0:
+        _cache = PredictionCache(max_entries, ttl_seconds, parse_quantization(quantize, model.feature_names))
+        logging.info(f"Prediction cache enabled: {max_entries} entries, ttl {ttl_seconds}s, quantize '{quantize}'")
+    return _cache
+
+
+def configure_drift(model, profile_path, n_bins=10, half_life_rows=100_000):
+    """Enable drift monitoring against the training profile at profile_path, or disable it (n_bins 0 or no profile)."""
+    global _drift
+    _drift = None
+    if n_bins > 0 and os.path.exists(profile_path):
+        profile = load_profile(profile_path)
+        if PREDICTION_COLUMN not in profile["columns"]:
+            logging.warning(f"{profile_path} predates prediction profiles; retrain to enable drift monitoring")
+            return None
+        _drift = DriftMonitor(profile, model.feature_names, n_bins, half_life_rows=half_life_rows)
+        logging.info(f"Drift monitoring enabled against {profile_path} with {n_bins} bins per column")
+    return _drift
+
+
+def model_fn(model_dir):
+    if model_dir not in _models:
+        _models[model_dir] = load_model(model_dir)
+        if PREDICTION_CACHE_SIZE > 0 and _cache is None:
+            configure_cache(_models[model_dir], PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, PREDICTION_CACHE_QUANTIZE)
+        if _drift is None:
+            configure_drift(_models[model_dir], os.path.join(model_dir, PROFILE_NAME), DRIFT_BINS,
+                            DRIFT_HALF_LIFE_ROWS)
+    return _models[model_dir]
+
+
+def validate_columns(columns, feature_names):
+    if list(columns) != list(feature_names):
+        raise ValueError(f"Expected columns {list(feature_names)} in this order, got {list(columns)}")
+
+
+def validate_matrix(X: np.ndarray, feature_names) -> np.ndarray:
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    if X.ndim != 2 or X.shape[1] != len(feature_names):
+        raise ValueError(f"Expected rows of {len(feature_names)} values {list(feature_names)}, got shape {X.shape}")
+    return X
+
+
+def parse_csv(body: bytes, feature_names) -> np.ndarray:
+    """Parse comma separated rows of numbers in one pass; a header line, if present, must match the schema."""
+    lines = body.strip().splitlines()
+    if lines:
+        first_field = lines[0].split(b",", 1)[0]
+        try:
+            float(first_field)
+        except ValueError:
+            validate_columns(lines.pop(0).decode().strip().split(","), feature_names)
+    n_columns = len(feature_names)
+    if any(line.count(b",") != n_columns - 1 for line in lines):
+        raise ValueError(f"Every CSV row must have {n_columns} values {list(feature_names)}")
+    # Parsed as float64 and then cast, like sklearn does with float64 input.
+    values = np.fromstring(b",".join(lines), dtype=np.float64, sep=",") if lines else np.empty(0)
+    if values.size != len(lines) * n_columns:
+        raise ValueError("CSV body contains values that are not numbers")
+    return values.reshape(len(lines), n_columns).astype(np.float32)
+
+
+def parse_json(body: bytes, feature_names) -> np.ndarray:
+    """Accept {"columns": [...], "data": [[...]]}, {"instances": [...]}, a list of rows, or record(s) keyed by feature."""
+    payload = json.loads(body)
+    if isinstance(payload, dict) and ("data" in payload or "instances" in payload):
+        if "columns" in payload:
+            validate_columns(payload["columns"], feature_names)
+        payload = payload.get("data", payload.get("instances"))
+    if isinstance(payload, dict):
+        payload = [payload]
+    if payload and isinstance(payload[0], dict):
+        try:
+            payload = [[record[name] for name in feature_names] for record in payload]
+        except KeyError as e:
+            raise ValueError(f"Record is missing feature {e}") from None
+    return validate_matrix(np.asarray(payload, dtype=np.float64), feature_names).astype(np.float32)
+
+
+def parse_npy(body: bytes, feature_names) -> np.ndarray:
+    """A .npy array of rows; structured arrays must name their fields in schema order."""
+    array = np.load(io.BytesIO(body), allow_pickle=False)
+    if array.dtype.names is not None:
+        validate_columns(array.dtype.names, feature_names)
+        array = recfunctions.structured_to_unstructured(array)
+    return np.ascontiguousarray(validate_matrix(array, feature_names), dtype=np.float32)
+
+
+PARSERS = {
+    CSV_CONTENT_TYPE: parse_csv,
+    JSON_CONTENT_TYPE: parse_json,
+    NPY_CONTENT_TYPE: parse_npy,
+}
+
+
+def media_type(content_type):
+    return (content_type or CSV_CONTENT_TYPE).split(";")[0].strip().lower()
+
+
+def input_fn(request_body, request_content_type, model=None):
+    """Parse a request into a float32 matrix in training column order."""
+    content_type = media_type(request_content_type)
+    if content_type not in PARSERS:
+        raise ValueError(f"Unsupported content type {request_content_type}, expected one of {CONTENT_TYPES}")
+    if isinstance(request_body, str):
+        request_body = request_body.encode()
+    # SageMaker calls input_fn without the model; model_fn has already cached it by then.
+    if model is None:
+        model = next(iter(_models.values()))
+    return PARSERS[content_type](request_body, model.feature_names)
+
+
+def predict_fn(input_data, model):
+    if _cache is not None:
+        prediction = _cache.predict(model, input_data)
+    else:
+        prediction = model.predict(input_data)
+    if _drift is not None:
+        _drift.update(input_data, prediction)
+    return prediction
+
+
+def cache_metrics():
+    return None if _cache is None else _cache.metrics()
+
+
+def drift_metrics():
+    return None if _drift is None else _drift.metrics()
+
+
+def output_fn(prediction, accept):
+    accept = media_type(accept)
+    if accept in (CSV_CONTENT_TYPE, "*/*"):
+        return "\n".join(map(repr, prediction.tolist())), CSV_CONTENT_TYPE
+    if accept == JSON_CONTENT_TYPE:
+        return json.dumps({"predictions": prediction.tolist()}), JSON_CONTENT_TYPE
+    if accept == NPY_CONTENT_TYPE:
+        buffer = io.BytesIO()
+        np.save(buffer, prediction, allow_pickle=False)
+        return buffer.getvalue(), NPY_CONTENT_TYPE
+    raise ValueError(f"Unsupported accept type {accept}, expected one of {CONTENT_TYPES}")
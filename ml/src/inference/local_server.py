@@ -0,0 +1,119 @@
+"""Serve inference.py over HTTP like the SageMaker container does (GET /ping, POST /invocations),
+plus GET /metrics for the prediction cache, drift scores and micro-batching counters.
+
+    python ml/src/inference/local_server.py --model_dir /tmp/model --port 8080
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import logging
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import inference
+from batching import MicroBatcher
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir", required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max_batch_size", type=int, default=0,
+                        help="Coalesce concurrent requests into micro-batches of up to this many rows; 0 disables")
+    parser.add_argument("--max_wait_ms", type=float, default=2.0,
+                        help="How long a micro-batch waits for more requests after its first one")
+    parser.add_argument("--cache_size", type=int, default=inference.PREDICTION_CACHE_SIZE,
+                        help="Entries in the prediction cache; 0 disables it")
+    parser.add_argument("--cache_ttl", type=float, default=inference.PREDICTION_CACHE_TTL)
+    parser.add_argument("--cache_quantize", default=inference.PREDICTION_CACHE_QUANTIZE,
+                        help='Per-feature rounding steps for cache keys, e.g. "trip_distance=0.1"')
+    return parser.parse_args()
+
+
+class InferenceServer:
+    """Minimal HTTP/1.1 keep-alive server that runs input_fn, predict_fn and output_fn per request,
+    optionally sharing predict calls between concurrent requests through a MicroBatcher."""
+
+    def __init__(self, model_dir, max_batch_size=0, max_wait_ms=2.0, cache_size=0, cache_ttl=None, cache_quantize=""):
+        self.model = inference.model_fn(model_dir)
+        inference.configure_cache(self.model, cache_size, cache_ttl, cache_quantize)
+        self.batcher = None
+        if max_batch_size > 0:
+            self.batcher = MicroBatcher(lambda X: inference.predict_fn(X, self.model), max_batch_size, max_wait_ms)
+
+    async def invoke(self, body, content_type, accept):
+        data = inference.input_fn(body, content_type, self.model)
+        if self.batcher is not None:
+            prediction = await self.batcher.predict(data)
+        else:
+            prediction = inference.predict_fn(data, self.model)
+        return inference.output_fn(prediction, accept)
+
+    async def respond(self, method, path, headers, body):
+        if method == "GET" and path == "/ping":
+            return 200, b"", "text/plain"
+        if method == "GET" and path == "/metrics":
+            metrics = {"prediction_cache": inference.cache_metrics(), "drift": inference.drift_metrics()}
+            if self.batcher is not None:
+                metrics["micro_batching"] = {"requests": self.batcher.requests, "batches": self.batcher.batches}
+            return 200, json.dumps(metrics).encode(), "application/json"
+        if method == "POST" and path == "/invocations":
+            try:
+                response, content_type = await self.invoke(body, headers.get("content-type"), headers.get("accept"))
+            except ValueError as e:
+                return 400, str(e).encode(), "text/plain"
+            except Exception as e:
+                logging.exception("Invocation failed")
+                return 500, str(e).encode(), "text/plain"
+            return 200, response.encode() if isinstance(response, str) else response, content_type
+        return 404, b"", "text/plain"
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, response, content_type = await self.respond(method, path, headers, body)
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(response)}\r\n\r\n".encode("latin-1") + response
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        logging.info(f"Serving on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    args = parse_args()
+    server = InferenceServer(args.model_dir, args.max_batch_size, args.max_wait_ms,
+                             args.cache_size, args.cache_ttl, args.cache_quantize)
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
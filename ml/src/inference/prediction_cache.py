@@ -0,0 +1,124 @@
+import sys
+import time
+import logging
+from collections import OrderedDict
+import numpy as np
+
+
+def parse_quantization(spec, feature_names):
+    """Parse "trip_distance=0.1,passenger_count=1" into a per-column step array (0 = keep exact)."""
+    steps = np.zeros(len(feature_names), dtype=np.float64)
+    for item in filter(None, (spec or "").split(",")):
+        name, step = item.split("=")
+        if name.strip() not in feature_names:
+            raise ValueError(f"Cannot quantize unknown feature {name.strip()}")
+        steps[list(feature_names).index(name.strip())] = float(step)
+    return steps
+
+
+def entry_size(key, entry):
+    return sys.getsizeof(key) + sys.getsizeof(entry) + sys.getsizeof(entry[0])
+
+
+class PredictionCache:
+    """LRU cache of predictions keyed on the canonical bytes of a quantized float32 feature row.
+
+    Rows are quantized before both the lookup and the prediction, so a cached
+    answer always equals what the model returns for that request. Entries older
+    than ttl_seconds are treated as misses, and the whole cache is dropped when
+    the model version changes.
+    """
+
+    def __init__(self, max_entries=100_000, ttl_seconds=None, quantization=None, log_every=10_000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.quantization = quantization
+        self.log_every = log_every
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.entry_bytes = 0
+
+    def quantize(self, X: np.ndarray) -> np.ndarray:
+        if self.quantization is None or not self.quantization.any():
+            return np.ascontiguousarray(X, dtype=np.float32)
+        steps = np.where(self.quantization > 0, self.quantization, 1)
+        quantized = np.where(self.quantization > 0, np.round(X / steps) * steps, X)
+        return np.ascontiguousarray(quantized, dtype=np.float32)
+
+    def clear(self):
+        self.entries.clear()
+        self.entry_bytes = 0
+
+    def ensure_version(self, version):
+        if version != self.version:
+            if self.entries:
+                logging.info(f"Model version changed from {self.version} to {version}; dropping "
+                             f"{len(self.entries)} cached predictions")
+            self.clear()
+            self.version = version
+
+    def get(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        prediction, expires_at = entry
+        if expires_at is not None and expires_at < now:
+            self.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return prediction
+
+    def put(self, key, prediction, now):
+        if key in self.entries:
+            self.remove(key)
+        expires_at = None if self.ttl_seconds is None else now + self.ttl_seconds
+        entry = (prediction, expires_at)
+        self.entries[key] = entry
+        self.entry_bytes += entry_size(key, entry)
+        while len(self.entries) > self.max_entries:
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def remove(self, key):
+        self.entry_bytes -= entry_size(key, self.entries.pop(key))
+
+    def predict(self, model, X: np.ndarray) -> np.ndarray:
+        """Answer cached rows from memory and send only the misses to model.predict."""
+        self.ensure_version(model.version)
+        X = self.quantize(X)
+        keys = [row.tobytes() for row in X]
+        now = time.monotonic()
+        predictions = np.empty(len(X), dtype=np.float64)
+        missing = []
+        for i, key in enumerate(keys):
+            cached = self.get(key, now)
+            if cached is None:
+                missing.append(i)
+            else:
+                predictions[i] = cached
+        if missing:
+            predictions[missing] = model.predict(X[missing])
+            for i in missing:
+                self.put(keys[i], float(predictions[i]), now)
+
+        before = self.hits + self.misses
+        self.hits += len(X) - len(missing)
+        self.misses += len(missing)
+        if self.log_every and (before // self.log_every) != ((self.hits + self.misses) // self.log_every):
+            logging.info(f"Prediction cache: {self.metrics()}")
+        return predictions
+
+    def metrics(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "memory_bytes": sys.getsizeof(self.entries) + self.entry_bytes,
+            "model_version": self.version,
+        }
@@ -0,0 +1,80 @@
+import logging
+import numpy as np
+import pandas as pd
+
+
+def row_hashes(data: pd.DataFrame) -> np.ndarray:
+	"""One uint64 key per row, hashed over the values of every column.
+
+	Equal rows get equal keys; distinct rows collide with probability about
+	n^2 / 2^65 for n rows, i.e. well under one in a thousand for 100M trips.
+	"""
+	return pd.util.hash_pandas_object(data, index=False).to_numpy()
+
+
+def _isin_sorted(keys: np.ndarray, sorted_keys: np.ndarray) -> np.ndarray:
+	if not len(sorted_keys):
+		return np.zeros(len(keys), dtype=bool)
+	positions = np.searchsorted(sorted_keys, keys)
+	positions[positions == len(sorted_keys)] = 0
+	return sorted_keys[positions] == keys
+
+
+class RowDeduplicator:
+	"""Drops rows whose key was already seen, in this frame or an earlier one.
+
+	Seen keys are kept as a few sorted uint64 runs (8 bytes per distinct
+	row). A new run is merged into the previous one while that one is less
+	than twice its size, so lookups touch O(log n) runs and each key is
+	merged O(log n) times.
+	"""
+
+	def __init__(self, runs=None):
+		self._runs = list(runs or [])
+
+	@property
+	def n_seen(self):
+		return sum(len(run) for run in self._runs)
+
+	def _seen(self, keys):
+		# searching in sorted order keeps the binary searches cache friendly
+		order = np.argsort(keys)
+		sorted_keys = keys[order]
+		seen_sorted = np.zeros(len(keys), dtype=bool)
+		for run in self._runs:
+			seen_sorted |= _isin_sorted(sorted_keys, run)
+		seen = np.empty_like(seen_sorted)
+		seen[order] = seen_sorted
+		return seen
+
+	def _add(self, keys):
+		self._runs.append(np.sort(keys))
+		while len(self._runs) > 1 and len(self._runs[-2]) < 2 * len(self._runs[-1]):
+			newest = self._runs.pop()
+			# runs are disjoint and sorted, so a stable sort of the pair is a linear merge
+			self._runs[-1] = np.sort(np.concatenate([self._runs[-1], newest]), kind="stable")
+
+	def drop_duplicates(self, data: pd.DataFrame):
+		"""Return data without repeated rows, and how many were dropped.
+
+		The first occurrence is kept, as in DataFrame.drop_duplicates.
+		"""
+		keys = row_hashes(data)
+		duplicated = pd.Series(keys).duplicated().to_numpy()
+		if self._runs:
+			duplicated = duplicated | self._seen(keys)
+		self._add(keys[~duplicated])
+		return data[~duplicated], int(duplicated.sum())
+
+	def save(self, path):
+		"""Persist the seen keys so a later run keeps deduplicating against them."""
+		keys = np.concatenate(self._runs) if self._runs else np.empty(0, dtype=np.uint64)
+		with open(path, "wb") as f:
+			np.save(f, np.sort(keys))
+		logging.info(f"Saved {len(keys)} seen row keys to {path}")
+
+	@classmethod
+	def load(cls, path):
+		keys = np.load(path)
+		logging.info(f"Loaded {len(keys)} seen row keys from {path}")
+		return cls([keys] if len(keys) else [])
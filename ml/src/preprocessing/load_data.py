@@ -1,93 +1,518 @@
 import boto3
-import pandas as pd 
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import operator
 import argparse
 import io
 import logging
 from botocore.exceptions import ClientError
 from sklearn.model_selection import train_test_split
 import os
+import sys
+import glob
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from boto3.s3.transfer import TransferConfig
 
-logging.basicConfig(level=logging.INFO,    
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.data_profile import PROFILE_NAME, DataProfile, write_profiles
+from common.dataset_io import FORMATS, DatasetWriter, read_dataset, write_dataset
+from common.zone_features import (ZONE_COLUMNS, build_out_of_fold_zone_features, build_zone_features,
+								  save_out_of_fold_zone_features, save_zone_features)
+from dedup import RowDeduplicator, row_hashes
+from shard_cache import ShardCache, open_cache_store
+
+logging.basicConfig(level=logging.INFO,
 					format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
 					datefmt='%Y-%m-%d %H:%M:%S')
 
+COLUMNS_TO_REMOVE = ["VendorID", "tpep_pickup_datetime", "tpep_dropoff_datetime", "RatecodeID", "store_and_fwd_flag",
+                     "extra", "mta_tax", "tip_amount", "tolls_amount", "improvement_surcharge", "total_amount", "congestion_surcharge", "Airport_fee" ,"cbd_congestion_fee"]
+
+# Columns that survive process_data, in file order. Parquet reads project to these.
+KEPT_COLUMNS = ["passenger_count", "trip_distance", "PULocationID", "DOLocationID", "payment_type", "fare_amount"]
+
+# Compact in-memory dtypes the kept columns are downcast to before deduplication.
+# Categorical columns declare the TLC codes so every batch shares the same categories.
+DOWNCAST_SCHEMA = {
+	"passenger_count": "Int8",
+	"trip_distance": "float32",
+	"PULocationID": pd.CategoricalDtype(range(1, 266)),
+	"DOLocationID": pd.CategoricalDtype(range(1, 266)),
+	"payment_type": pd.CategoricalDtype(range(0, 7)),
+	"fare_amount": "float32",
+}
+
+# Rows to keep, as (column, op, value) predicates ANDed together. Parquet reads
+# push them into the scan so row groups whose statistics rule them out are skipped.
+ROW_FILTERS = [("fare_amount", ">", 0), ("trip_distance", ">", 0)]
+
+_FILTER_OPS = {"==": operator.eq, "!=": operator.ne, "<": operator.lt,
+			   "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
 args = None
 
 def parse_arguments():
 	global args
 	parser = argparse.ArgumentParser()
-	parser.add_argument("--input_file_path", required=False, default="/opt/ml/processing/input/yellow_tripdata_v1.parquet")
+	parser.add_argument("--input_file_path", required=False, default="/opt/ml/processing/input/yellow_tripdata_v1.parquet",
+						help="A file, a directory searched recursively for --format files, or a glob pattern")
 	parser.add_argument("--is_local", required=False)
 	parser.add_argument("--format", default="parquet")
 	parser.add_argument("--output_train_file_path", required=False, default="/opt/ml/processing/output/train.csv")
 	parser.add_argument("--output_test_file_path", required=False, default="/opt/ml/processing/output/test.csv")
 	parser.add_argument("--target", required=True)
+	parser.add_argument("--test_size", type=float, default=0.2)
+	parser.add_argument("--random_state", type=int, default=None)
+	parser.add_argument("--split_mode", choices=["random", "hash"], default="random",
+						help="random: train_test_split; hash: assign rows by a stable hash of --split_key")
+	parser.add_argument("--split_key", nargs="+", default=None,
+						help="Columns hashed by --split_mode hash; all columns by default")
+	parser.add_argument("--streaming", action="store_true",
+						help="Process the parquet input batch by batch instead of loading it whole")
+	parser.add_argument("--batch_size", type=int, default=500_000)
+	parser.add_argument("--n_workers", type=int, default=os.cpu_count(),
+						help="Processes reading input files in parallel when there are several")
+	parser.add_argument("--skip_row_filters", action="store_true",
+						help="Keep rows rejected by ROW_FILTERS")
+	parser.add_argument("--dedup_state_path", default=None,
+						help="File of row keys seen by earlier runs; loaded if present and updated afterwards")
+	parser.add_argument("--cache_uri", default=None,
+						help="Local directory or s3://bucket/prefix caching processed shards per input file")
+	parser.add_argument("--cache_max_bytes", type=int, default=5 * 1024 ** 3)
+	parser.add_argument("--output_format", choices=FORMATS, default="csv")
+	parser.add_argument("--compression", default=None,
+						help="parquet/feather codec, e.g. snappy, zstd, lz4 or uncompressed")
+	parser.add_argument("--profile_name", default=PROFILE_NAME,
+						help="Profile of the train and test splits written next to the train output; empty to skip")
+	parser.add_argument("--zone_features_dir", default=None,
+						help="Build per-zone and zone-pair aggregates of the train split into this directory")
+	parser.add_argument("--zone_min_count", type=int, default=20,
+						help="Zones and zone pairs with fewer train trips use a coarser median")
+	parser.add_argument("--zone_folds", type=int, default=5,
+						help="Folds of the out-of-fold zone features the model is trained on; 0 trains on the "
+							 "full store")
 
 	args = parser.parse_args()
 
-parse_arguments()
-
 client = boto3.client("s3")
-def load_data():
-	input_path = args.input_file_path
 
+def filter_expression(filters):
+	"""Build a pyarrow dataset expression from (column, op, value) predicates."""
+	expression = None
+	for column, op, value in filters:
+		predicate = _FILTER_OPS[op](ds.field(column), value)
+		expression = predicate if expression is None else expression & predicate
+	return expression
+
+def apply_row_filters(data: pd.DataFrame, filters):
+	"""Apply the same predicates as filter_expression to an in-memory frame."""
+	if not filters:
+		return data
+	mask = pd.Series(True, index=data.index)
+	for column, op, value in filters:
+		mask &= _FILTER_OPS[op](data[column], value)
+	return data[mask]
+
+def load_data(input_path, file_format="parquet", columns=None, filters=None):
 	logging.info(f"loading data from {input_path}")
 
-	if args.format == "parquet":
-		data = pd.read_parquet(input_path)
+	if file_format == "parquet":
+		data = pd.read_parquet(input_path, columns=columns, filters=filters or None)
 		logging.info(f"Data is loaded succesfully")
 		return data
-	else: 
-		data = pd.read_csv(input_path)
+	else:
+		data = pd.read_csv(input_path, usecols=columns)
+		data = apply_row_filters(data, filters)
 		logging.info(f"Data is loaded succesfully")
 		return data
 
-def process_data(data: pd.DataFrame):
-	columns_to_remove = ["VendorID", "tpep_pickup_datetime", "tpep_dropoff_datetime", "RatecodeID", "store_and_fwd_flag",
-                     "extra", "mta_tax", "tip_amount", "tolls_amount", "improvement_surcharge", "total_amount", "congestion_surcharge", "Airport_fee" ,"cbd_congestion_fee"]
-	
-	data_raw_selected = data.drop(columns=columns_to_remove, axis=1)
-	logging.info(f"{columns_to_remove} are dropped")
-	
-	logging.info(f"{data_raw_selected.isna().sum()} are dropped")
-
-	logging.info(f"Null values \n{data_raw_selected.isna().sum()}")
-	data_raw_selected.passenger_count.fillna(data_raw_selected.passenger_count.mode()[0], inplace=True)
-	
-	logging.info(f"Total duplicates \n{data_raw_selected.duplicated().sum()}")
-	data_raw_selected.drop_duplicates(inplace=True)
+def resolve_input_files(input_path, file_format="parquet"):
+	"""Sorted input files for a file path, a directory or a glob pattern."""
+	if os.path.isdir(input_path):
+		input_files = glob.glob(os.path.join(input_path, "**", f"*.{file_format}"), recursive=True)
+	elif glob.has_magic(input_path):
+		input_files = glob.glob(input_path, recursive=True)
+	else:
+		input_files = [input_path]
+	if not input_files:
+		raise FileNotFoundError(f"No {file_format} files found for {input_path}")
+	logging.info(f"{len(input_files)} input files found for {input_path}")
+	return sorted(input_files)
+
+def parquet_dataset(source):
+	"""pyarrow dataset over a parquet path, or over an open file object."""
+	if isinstance(source, (str, os.PathLike)):
+		return ds.dataset(source, format="parquet")
+	parquet_format = ds.ParquetFileFormat()
+	fragment = parquet_format.make_fragment(pa.PythonFile(source, mode="r"))
+	return ds.FileSystemDataset([fragment], fragment.physical_schema, parquet_format)
+
+def iter_parquet_batches(input_path, batch_size, columns=KEPT_COLUMNS, filters=None):
+	"""Yield column-projected, filtered DataFrames of batch_size rows (the last may be shorter).
+
+	Scanner batches, which never span row groups, are coalesced up to
+	batch_size. Each batch is indexed by its row position in the filtered
+	file, matching the index of the in-memory path.
+	"""
+	dataset = parquet_dataset(input_path)
+	logging.info(f"Streaming {input_path} with columns {columns} and filters {filters}")
+	offset = 0
+	pending = []
+	pending_rows = 0
+
+	def to_frame(table):
+		frame = table.to_pandas()
+		frame.index = pd.RangeIndex(offset, offset + len(frame))
+		return frame
+
+	for batch in dataset.to_batches(columns=columns, filter=filter_expression(filters or []), batch_size=batch_size,
+									batch_readahead=1, fragment_readahead=1):
+		if batch.num_rows == 0:
+			continue
+		pending.append(batch)
+		pending_rows += batch.num_rows
+		if pending_rows >= batch_size:
+			table = pa.Table.from_batches(pending)
+			yield to_frame(table.slice(0, batch_size))
+			offset += batch_size
+			remainder = table.slice(batch_size)
+			pending = remainder.to_batches() if remainder.num_rows else []
+			pending_rows = remainder.num_rows
+	if pending_rows:
+		yield to_frame(pa.Table.from_batches(pending))
+
+def passenger_count_counts(input_path, batch_size, filters=None):
+	"""value_counts of passenger_count over one filtered file, reading only the columns it needs."""
+	counts = pd.Series(dtype="float64")
+	for batch in iter_parquet_batches(input_path, batch_size, columns=["passenger_count"], filters=filters):
+		counts = counts.add(batch.passenger_count.value_counts(), fill_value=0)
+	return counts
+
+def passenger_count_mode(input_paths, batch_size, filters=None, n_workers=1):
+	"""Mode of passenger_count over all filtered input files."""
+	count_args = ([batch_size] * len(input_paths), [filters] * len(input_paths))
+	if n_workers > 1 and len(input_paths) > 1:
+		with ProcessPoolExecutor(min(n_workers, len(input_paths))) as pool:
+			file_counts = list(pool.map(passenger_count_counts, input_paths, *count_args))
+	else:
+		file_counts = list(map(passenger_count_counts, input_paths, *count_args))
+	counts = pd.Series(dtype="float64")
+	for file_count in file_counts:
+		counts = counts.add(file_count, fill_value=0)
+	# pandas' mode() breaks ties on the smallest value; idxmax on a sorted index does the same
+	return counts.sort_index().idxmax()
+
+def downcast_data(data: pd.DataFrame, schema=DOWNCAST_SCHEMA):
+	"""Cast the columns named in schema to their compact dtype, column by column.
+
+	Codes missing from a declared categorical dtype are added to its
+	categories (with a warning) rather than turned into nulls.
+	"""
+	bytes_before = data.memory_usage(deep=True, index=False)
+	for column, dtype in schema.items():
+		if column not in data.columns:
+			continue
+		if isinstance(dtype, pd.CategoricalDtype):
+			unknown = pd.Index(data[column].dropna().unique()).difference(dtype.categories)
+			if len(unknown):
+				logging.warning(f"{column} has codes outside its declared categories: {list(unknown)}")
+				dtype = pd.CategoricalDtype(dtype.categories.union(unknown))
+		data[column] = data[column].astype(dtype)
+	bytes_after = data.memory_usage(deep=True, index=False)
+	report = pd.DataFrame({"before": bytes_before, "after": bytes_after, "saved": bytes_before - bytes_after})
+	logging.info(f"Downcast memory usage (bytes) \n{report}\nTotal saved {report.saved.sum()}")
+	return data
+
+def read_input_file(input_path, file_format="parquet", filters=None):
+	"""Read one input file projected to KEPT_COLUMNS, filtered and downcast. Runs in a worker process."""
+	return downcast_data(load_data(input_path, file_format, columns=KEPT_COLUMNS, filters=filters))
+
+def iter_input_frames(input_paths, file_format="parquet", filters=None, n_workers=1, cache=None):
+	"""Yield read_input_file for each path, in order.
+
+	With several workers, up to n_workers files are read ahead in a process
+	pool; results are still yielded in input order so the output is the same
+	as a sequential read. Files found in cache are not read at all, and
+	files that are read are added to it.
+	"""
+	pool = None
+	if n_workers > 1 and len(input_paths) > 1:
+		pool = ProcessPoolExecutor(min(n_workers, len(input_paths)))
+
+	def start(input_path):
+		cached = cache.get(input_path) if cache is not None else None
+		if cached is not None:
+			return downcast_data(cached)
+		if pool is not None:
+			return pool.submit(read_input_file, input_path, file_format, filters)
+		return None
+
+	try:
+		window = n_workers if pool is not None else 1
+		pending = deque((input_path, start(input_path)) for input_path in input_paths[:window])
+		next_paths = iter(input_paths[window:])
+		while pending:
+			input_path, started = pending.popleft()
+			next_path = next(next_paths, None)
+			if next_path is not None:
+				pending.append((next_path, start(next_path)))
+
+			if isinstance(started, pd.DataFrame):
+				yield started
+				continue
+			data = started.result() if started is not None else read_input_file(input_path, file_format, filters)
+			if cache is not None:
+				cache.put(input_path, data)
+			yield data
+	finally:
+		if pool is not None:
+			pool.shutdown()
+
+def iter_streaming_batches(input_paths, batch_size, filters=None, n_workers=1, cache=None):
+	"""Batches of at most batch_size kept, filtered rows over all parquet inputs, in order.
+
+	Without a cache, a single file or a sequential run is streamed row group
+	by row group. Otherwise files are read whole (in parallel, or from the
+	cache) by iter_input_frames and sliced, so memory holds up to n_workers
+	downcast files.
+	"""
+	if cache is None and (n_workers <= 1 or len(input_paths) == 1):
+		for input_path in input_paths:
+			yield from iter_parquet_batches(input_path, batch_size, filters=filters)
+		return
+	for data in iter_input_frames(input_paths, "parquet", filters, n_workers, cache):
+		for start in range(0, len(data), batch_size):
+			yield data.iloc[start:start + batch_size]
+
+def prepare_features(data: pd.DataFrame, passenger_fill=None):
+	"""Drop unused columns, downcast and fill passenger_count; shared by preprocessing and batch scoring."""
+	dropped_columns = [col for col in COLUMNS_TO_REMOVE if col in data.columns]
+	data_raw_selected = data.drop(columns=dropped_columns)
+	logging.info(f"Columns dropped: {dropped_columns}")
+
+	data_raw_selected = downcast_data(data_raw_selected)
+
+	# Only passenger_count is filled; other nulls are kept. All of them are counted in the profile.
+	if passenger_fill is None:
+		passenger_fill = data_raw_selected.passenger_count.mode()[0]
+	data_raw_selected["passenger_count"] = data_raw_selected.passenger_count.fillna(passenger_fill)
 	return data_raw_selected
 
+def process_data(data: pd.DataFrame, passenger_fill=None, deduplicator=None):
+	data_raw_selected = prepare_features(data, passenger_fill)
+
+	deduplicator = deduplicator or RowDeduplicator()
+	data_raw_selected, n_duplicates = deduplicator.drop_duplicates(data_raw_selected)
+	logging.info(f"Total duplicates \n{n_duplicates}")
+	return data_raw_selected
+
+
+def split_data(data: pd.DataFrame, target, test_size=0.2, random_state=None):
+	inde = data.drop(target, axis=1)
+	target_values = data[target]
 
-def save_data(data: pd.DataFrame, save_path):
-    try: 
-        data.to_csv(save_path)
+	if len(data) < 2:
+		# train_test_split cannot split a single row; keep it for training
+		return data, data.iloc[0:0]
+
+	X_train, x_test, y_train, y_test = train_test_split(inde, target_values, test_size=test_size,
+													   shuffle=True, random_state=random_state)
+	train_data = pd.concat([X_train, y_train], axis=1)
+	test_data = pd.concat([x_test, y_test], axis=1)
+	return train_data, test_data
+
+
+def hash_split_data(data: pd.DataFrame, test_size=0.2, key_columns=None):
+	"""Split rows by a stable hash of key_columns (all columns by default).
+
+	A row lands in test when its hash, scaled to [0, 1), is below test_size.
+	The assignment depends only on the row itself, so it is the same across
+	runs, batch sizes and appended months, and needs no shuffle or concat.
+	Rows whose passenger_count was imputed keep their side only while the
+	fill value does; leave passenger_count out of key_columns to avoid that.
+	"""
+	keys = row_hashes(data[key_columns] if key_columns else data)
+	in_test = (keys >> 11) * 2.0 ** -53 < test_size
+	return data[~in_test], data[in_test]
+
+
+def save_data(data: pd.DataFrame, save_path, file_format="csv", compression=None):
+    try:
+        write_dataset(data, save_path, file_format, compression)
         logging.info(f"Processed data uploaded to {save_path}")
 
     except Exception as e:
         logging.error(f"Error while uploading processed data: {e}", exc_info=True)
 
 
+def row_filters():
+	return [] if args.skip_row_filters else ROW_FILTERS
+
+
+def split_processed_data(data: pd.DataFrame, random_state=None):
+	if args.split_mode == "hash":
+		return hash_split_data(data, args.test_size, args.split_key)
+	return split_data(data, args.target, args.test_size, random_state)
+
+
+def open_cache():
+	if not args.cache_uri:
+		return None
+	# shards depend on what preprocessing keeps, so that is part of every shard key
+	config = repr((KEPT_COLUMNS, row_filters(), DOWNCAST_SCHEMA))
+	config_key = hashlib.sha256(config.encode()).hexdigest()[:12]
+	return ShardCache(open_cache_store(args.cache_uri, client), config_key, args.cache_max_bytes)
+
+
+def load_deduplicator():
+	if args.dedup_state_path and os.path.exists(args.dedup_state_path):
+		return RowDeduplicator.load(args.dedup_state_path)
+	return RowDeduplicator()
+
+
+def save_deduplicator(deduplicator):
+	if args.dedup_state_path:
+		deduplicator.save(args.dedup_state_path)
+
+
+def profile_path():
+	if not args.profile_name:
+		return None
+	return os.path.join(os.path.dirname(os.path.abspath(args.output_train_file_path)), args.profile_name)
+
+
+def passenger_count_nulls(data: pd.DataFrame):
+	"""Rows of a raw frame whose passenger_count process_data fills; None when no profile is written."""
+	return data.passenger_count.isna() if profile_path() else None
+
+
+def profile_split(profile: DataProfile, split: pd.DataFrame, filled):
+	"""Add a processed split to its profile, counting its filled passenger_count values as nulls."""
+	return profile.update(split, imputed={"passenger_count": filled.loc[split.index].to_numpy()})
+
+
+def save_profiles(profiles):
+	"""Write the train/test profiles and log their null counts, taken before passenger_count was filled."""
+	nulls = {name: sum(profile.columns[name].nulls for profile in profiles.values() if name in profile.columns)
+			 for name in KEPT_COLUMNS}
+	logging.info(f"Null values before filling passenger_count: {nulls}")
+	write_profiles(profiles, profile_path())
+
+
+def build_and_save_zone_features():
+	"""Aggregate the written train split into the zone feature store; test rows are never used.
+
+	The full store is what serving and evaluation look up. The training rows
+	get their features from out-of-fold stores, so no row's own fare is in
+	the medians it is fitted on.
+	"""
+	if not args.zone_features_dir:
+		return
+	# All columns, as training reads them, since the folds are a hash of whole rows
+	train_data = read_dataset(args.output_train_file_path, args.output_format, memory_map=True)
+	zone_features = build_zone_features(train_data[ZONE_COLUMNS[0]], train_data[ZONE_COLUMNS[1]],
+										train_data[args.target], train_data["trip_distance"], args.zone_min_count)
+	save_zone_features(zone_features, args.zone_features_dir)
+	if args.zone_folds > 1:
+		save_out_of_fold_zone_features(
+			build_out_of_fold_zone_features(train_data, args.target, args.zone_folds, args.zone_min_count),
+			args.zone_features_dir)
+
+
 def process_and_save_data():
 	try:
-		data = load_data()
-		processed_data = process_data(data)
-
-		inde = processed_data.drop(args.target, axis=1)
-		target = processed_data[args.target]
+		input_paths = resolve_input_files(args.input_file_path, args.format)
+		cache = open_cache()
+		frames = list(iter_input_frames(input_paths, args.format, row_filters(), args.n_workers, cache))
+		data = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+		del frames
+		deduplicator = load_deduplicator()
+		filled = passenger_count_nulls(data)
+		processed_data = process_data(data, deduplicator=deduplicator)
 
-		X_train, x_test, y_train, y_test = train_test_split(inde,target, test_size=0.2, shuffle=True)
-		train_data = pd.concat([X_train, y_train], axis=1)
-		test_data = pd.concat([x_test, y_test], axis=1)
+		train_data, test_data = split_processed_data(processed_data, args.random_state)
 
-		save_data(train_data, args.output_train_file_path)
-		save_data(test_data, args.output_test_file_path)
-		
+		save_data(train_data, args.output_train_file_path, args.output_format, args.compression)
+		save_data(test_data, args.output_test_file_path, args.output_format, args.compression)
+		if profile_path():
+			save_profiles({"train": profile_split(DataProfile(), train_data, filled),
+						   "test": profile_split(DataProfile(), test_data, filled)})
+		del data, filled, processed_data, train_data, test_data
+		build_and_save_zone_features()
+		save_deduplicator(deduplicator)
+		if cache is not None:
+			cache.close()
 
 		logging.info(f'Successfully Done processing and saving data.')
 	except Exception as e:
 		logging.error(f'Error while processing data {e}')
 
+
+def stream_process_and_save_data():
+	"""Bounded-memory variant of process_and_save_data for parquet inputs.
+
+	Batches are processed and split independently and appended to the
+	train/test outputs. The passenger_count fill value is computed over all
+	inputs first, and with --split_mode random batch n is split with
+	random_state + n, so an input that fits in a single batch gives exactly
+	the in-memory output. --split_mode hash gives the same rows as the
+	in-memory path for any batch size.
+	A single RowDeduplicator is shared by all batches, so duplicates are
+	removed across all inputs.
+	"""
+	try:
+		input_paths = resolve_input_files(args.input_file_path, "parquet")
+		cache = open_cache()
+		if cache is None:
+			passenger_fill = passenger_count_mode(input_paths, args.batch_size, row_filters(), args.n_workers)
+		else:
+			# this pass fills the cache, so the processing pass below only reads shards
+			counts = pd.Series(dtype="float64")
+			for data in iter_input_frames(input_paths, "parquet", row_filters(), args.n_workers, cache):
+				counts = counts.add(data.passenger_count.value_counts(), fill_value=0)
+			passenger_fill = counts.sort_index().idxmax()
+		logging.info(f"passenger_count fill value {passenger_fill}")
+
+		train_writer = DatasetWriter(args.output_train_file_path, args.output_format, args.compression)
+		test_writer = DatasetWriter(args.output_test_file_path, args.output_format, args.compression)
+		deduplicator = load_deduplicator()
+		profiles = {"train": DataProfile(), "test": DataProfile()}
+		with train_writer, test_writer:
+			for batch_number, batch in enumerate(iter_streaming_batches(input_paths, args.batch_size,
+																		row_filters(), args.n_workers, cache)):
+				filled = passenger_count_nulls(batch)
+				processed_batch = process_data(batch, passenger_fill=passenger_fill, deduplicator=deduplicator)
+				random_state = None if args.random_state is None else args.random_state + batch_number
+				train_data, test_data = split_processed_data(processed_batch, random_state)
+
+				for split, writer, profile in ((train_data, train_writer, profiles["train"]),
+											   (test_data, test_writer, profiles["test"])):
+					# the first write always happens so an empty split still gets a file
+					if split.empty and writer.rows_written:
+						continue
+					writer.write(split)
+					if filled is not None:
+						profile_split(profile, split, filled)
+				logging.info(f"Batch {batch_number}: {len(train_data)} train rows, {len(test_data)} test rows")
+
+		if profile_path():
+			save_profiles(profiles)
+		build_and_save_zone_features()
+		save_deduplicator(deduplicator)
+		if cache is not None:
+			cache.close()
+		logging.info(f"{train_writer.rows_written} train rows saved to {args.output_train_file_path}, "
+					 f"{test_writer.rows_written} test rows saved to {args.output_test_file_path}")
+		logging.info(f'Successfully Done streaming, processing and saving data.')
+	except Exception as e:
+		logging.error(f'Error while processing data {e}')
+
 if __name__ == "__main__":
-	process_and_save_data()
+	parse_arguments()
+	if args.streaming:
+		stream_process_and_save_data()
+	else:
+		process_and_save_data()
@@ -0,0 +1,165 @@
+import os
+import io
+import json
+import time
+import hashlib
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from botocore.exceptions import ClientError
+
+from common.dataset_io import to_arrow_table
+
+
+class LocalCacheStore:
+	"""Cache objects stored as files under a local directory."""
+
+	def __init__(self, root):
+		self.root = root
+
+	def read(self, key):
+		path = os.path.join(self.root, key)
+		if not os.path.exists(path):
+			return None
+		with open(path, "rb") as f:
+			return f.read()
+
+	def write(self, key, data: bytes):
+		"""Write to a temporary file and rename it over the key, so a crash never leaves a partial object."""
+		path = os.path.join(self.root, key)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		tmp_path = f"{path}.tmp-{os.getpid()}"
+		with open(tmp_path, "wb") as f:
+			f.write(data)
+		os.replace(tmp_path, path)
+
+	def delete(self, key):
+		path = os.path.join(self.root, key)
+		if os.path.exists(path):
+			os.remove(path)
+
+
+class S3CacheStore:
+	"""Cache objects stored under an s3://bucket/prefix."""
+
+	def __init__(self, uri, client):
+		bucket_and_prefix = uri[len("s3://"):].rstrip("/")
+		self.bucket, _, self.prefix = bucket_and_prefix.partition("/")
+		self.client = client
+
+	def _key(self, key):
+		return f"{self.prefix}/{key}" if self.prefix else key
+
+	def read(self, key):
+		try:
+			return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"].read()
+		except ClientError as e:
+			if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+				return None
+			raise
+
+	def write(self, key, data: bytes):
+		# a PUT replaces the object atomically
+		self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+	def delete(self, key):
+		self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+
+def open_cache_store(uri, client=None):
+	if uri.startswith("s3://"):
+		return S3CacheStore(uri, client)
+	return LocalCacheStore(uri)
+
+
+def file_sha256(path, block_size=8 * 1024 * 1024):
+	digest = hashlib.sha256()
+	with open(path, "rb") as f:
+		for block in iter(lambda: f.read(block_size), b""):
+			digest.update(block)
+	return digest.hexdigest()
+
+
+class ShardCache:
+	"""Processed per-file shards keyed by the raw file's fingerprint.
+
+	The manifest records size, mtime and sha256 of each raw file next to its
+	shard. A file whose path, size and mtime match an entry is a hit without
+	being read; otherwise its content hash is looked up, so a re-downloaded
+	but unchanged file is still a hit. config_key is part of every shard key,
+	so changing what preprocessing keeps invalidates the whole cache.
+	Every put evicts least recently used shards until the cache holds at
+	most max_bytes of shards and rewrites the manifest before the shard, so
+	the cache stays within budget during a run and a crashed run leaves no
+	shard the manifest does not know about. close records the shards used
+	this run.
+	"""
+
+	MANIFEST_KEY = "manifest.json"
+
+	def __init__(self, store, config_key, max_bytes=5 * 1024 ** 3):
+		self.store = store
+		self.config_key = config_key
+		self.max_bytes = max_bytes
+		manifest = store.read(self.MANIFEST_KEY)
+		self.shards = json.loads(manifest)["shards"] if manifest else {}
+		self._fingerprints = {}
+		self.hits = 0
+		self.misses = 0
+
+	def _fingerprint(self, input_path):
+		stat = os.stat(input_path)
+		for shard_key, entry in self.shards.items():
+			if (entry["source"] == input_path and entry["size"] == stat.st_size
+					and entry["mtime"] == stat.st_mtime and entry["config_key"] == self.config_key):
+				return shard_key, entry
+		sha256 = file_sha256(input_path)
+		entry = {"source": input_path, "size": stat.st_size, "mtime": stat.st_mtime,
+				 "sha256": sha256, "config_key": self.config_key}
+		return f"{sha256}-{self.config_key}", entry
+
+	def get(self, input_path):
+		"""The cached shard for input_path, or None after remembering its fingerprint for put."""
+		shard_key, entry = self._fingerprint(input_path)
+		data = self.store.read(f"shards/{shard_key}.feather") if shard_key in self.shards else None
+		if data is None:
+			self._fingerprints[input_path] = (shard_key, entry)
+			self.misses += 1
+			return None
+		self.shards[shard_key].update(source=input_path, mtime=entry["mtime"], last_used=time.time())
+		self.hits += 1
+		logging.info(f"Cache hit for {input_path}")
+		return feather.read_table(pa.BufferReader(data)).to_pandas()
+
+	def put(self, input_path, data: pd.DataFrame):
+		shard_key, entry = self._fingerprints.pop(input_path, None) or self._fingerprint(input_path)
+		sink = io.BytesIO()
+		feather.write_feather(to_arrow_table(data), sink, compression="lz4")
+		self.shards[shard_key] = dict(entry, bytes=sink.tell(), last_used=time.time())
+		self.evict()
+		# Manifest first: after a crash between the two writes the entry has no
+		# shard, which get treats as a miss, rather than a shard nothing tracks.
+		self.write_manifest()
+		self.store.write(f"shards/{shard_key}.feather", sink.getvalue())
+		logging.info(f"Cached {len(data)} processed rows of {input_path} ({sink.tell()} bytes)")
+
+	def evict(self):
+		total_bytes = sum(entry["bytes"] for entry in self.shards.values())
+		for shard_key, entry in sorted(self.shards.items(), key=lambda item: item[1]["last_used"]):
+			if total_bytes <= self.max_bytes:
+				break
+			self.store.delete(f"shards/{shard_key}.feather")
+			del self.shards[shard_key]
+			total_bytes -= entry["bytes"]
+			logging.info(f"Evicted cached shard of {entry['source']}")
+		return total_bytes
+
+	def write_manifest(self):
+		self.store.write(self.MANIFEST_KEY, json.dumps({"shards": self.shards}, indent=1).encode())
+
+	def close(self):
+		total_bytes = self.evict()
+		self.write_manifest()
+		logging.info(f"Preprocessing cache: {self.hits} hits, {self.misses} misses, "
+					 f"{len(self.shards)} shards, {total_bytes} bytes")
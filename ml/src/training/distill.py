@@ -0,0 +1,167 @@
+"""Distill the trained forest into a small student model.
+
+The student is fitted on the teacher's predictions for a sample of the
+training rows, not on the noisy fares, so a few shallow trees (or one
+boosted model) can follow the forest closely. The student is packed as its
+own model.tar.gz, in the same layout as the training job's, so evaluate.py
+and the inference container load it like any other model.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tarfile
+import argparse
+import joblib
+import numpy as np
+import logging
+from sklearn.ensemble import RandomForestRegressor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.data_profile import PROFILE_NAME, write_model_profile
+from common.dataset_io import FORMATS, read_dataset
+from common.forest_arrays import forest_to_arrays, save_forest_arrays
+from common.forest_engine import ForestEngine
+from common.metrics import RegressionMetrics
+from common.zone_features import ZONE_FEATURES_DIR, load_zone_features
+from train_model import MODEL_TYPES, build_model
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+ARCHIVE_NAME = "model.tar.gz"
+REPORT_NAME = "distillation.json"
+
+args = None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--model_dir", default="/opt/ml/processing/model",
+                        help="Teacher model directory or extracted model.tar.gz")
+    parser.add_argument("--data_dir", default="/opt/ml/processing/input")
+    parser.add_argument("--output_dir", default="/opt/ml/processing/student")
+    parser.add_argument("--train_file_name", required=True)
+    parser.add_argument("--data_format", choices=FORMATS, default=None)
+    parser.add_argument("--model_name", default="model.pkl")
+    parser.add_argument("--forest_arrays_dir", default="forest")
+    parser.add_argument("--target", default="fare_amount")
+    parser.add_argument("--student_type", choices=MODEL_TYPES, default="forest")
+    parser.add_argument("--student_n_estimators", type=int, default=8,
+                        help="Trees of the student forest, or boosting iterations of a hist_gbm student")
+    parser.add_argument("--student_max_depth", type=int, default=8)
+    parser.add_argument("--learning_rate", type=float, default=0.1)
+    parser.add_argument("--sample_rows", type=int, default=2_000_000,
+                        help="Training rows labelled by the teacher; 0 uses all of them")
+    parser.add_argument("--random_state", type=int, default=58)
+
+    return parser.parse_args()
+
+
+def load_teacher(model_dir):
+    archive = os.path.join(model_dir, ARCHIVE_NAME)
+    if os.path.exists(archive):
+        with tarfile.open(archive, "r:gz") as tar:
+            tar.extractall(model_dir)
+        logging.info(f"Extracted {archive}")
+    forest_dir = os.path.join(model_dir, args.forest_arrays_dir)
+    if os.path.isdir(forest_dir):
+        return ForestEngine.load(forest_dir)
+    return joblib.load(os.path.join(model_dir, args.model_name))
+
+
+def load_sample(zone_features=None):
+    """Features of the sampled training rows, with the teacher's zone features appended if it has them."""
+    path = os.path.join(args.data_dir, args.train_file_name)
+    train_df = read_dataset(path, args.data_format, memory_map=True)
+    if args.sample_rows and args.sample_rows < len(train_df):
+        positions = np.sort(np.random.default_rng(args.random_state)
+                            .choice(len(train_df), args.sample_rows, replace=False))
+        train_df = train_df.iloc[positions]
+    X = train_df.drop(columns=args.target)
+    return X if zone_features is None else zone_features.apply(X)
+
+
+def predict_ms(model, X, rows=1000):
+    """Milliseconds to predict a batch of `rows` rows, best of three."""
+    X = X.iloc[:rows]
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        model.predict(X)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def save_student(student, output_dir, predictions):
+    """Write the student in the training job's layout (forest arrays or model.pkl) and packed as model.tar.gz."""
+    os.makedirs(output_dir, exist_ok=True)
+    if isinstance(student, RandomForestRegressor):
+        save_forest_arrays(forest_to_arrays(student), os.path.join(output_dir, args.forest_arrays_dir))
+        names = [args.forest_arrays_dir]
+    else:
+        joblib.dump(student, os.path.join(output_dir, args.model_name))
+        names = [args.model_name]
+    teacher_zone_features = os.path.join(args.model_dir, ZONE_FEATURES_DIR)
+    if os.path.isdir(teacher_zone_features):
+        # The student is fitted on the same zone features as the teacher
+        shutil.copytree(teacher_zone_features, os.path.join(output_dir, ZONE_FEATURES_DIR), dirs_exist_ok=True)
+        names.append(ZONE_FEATURES_DIR)
+    teacher_profile = os.path.join(args.model_dir, PROFILE_NAME)
+    if os.path.exists(teacher_profile):
+        # The drift reference for served predictions is the student's own.
+        write_model_profile(teacher_profile, predictions, os.path.join(output_dir, PROFILE_NAME))
+        names.append(PROFILE_NAME)
+    with tarfile.open(os.path.join(output_dir, ARCHIVE_NAME), "w:gz") as tar:
+        for name in names:
+            tar.add(os.path.join(output_dir, name), arcname=name)
+    logging.info(f"Student written to {os.path.join(output_dir, ARCHIVE_NAME)}")
+
+
+def main():
+    logging.info("Loading teacher...")
+    teacher = load_teacher(args.model_dir)
+    zone_features_dir = os.path.join(args.model_dir, ZONE_FEATURES_DIR)
+    X = load_sample(load_zone_features(zone_features_dir) if os.path.isdir(zone_features_dir) else None)
+    logging.info(f"Labelling {len(X)} rows with the teacher ({type(teacher).__name__})...")
+    soft_labels = teacher.predict(X)
+
+    student = build_model(args.student_type, X, args.student_n_estimators, args.student_max_depth,
+                          args.random_state, args.learning_rate)
+    logging.info(f"Training {args.student_type} student...")
+    start = time.perf_counter()
+    student.fit(X, soft_labels)
+    fit_seconds = time.perf_counter() - start
+
+    # Agreement with the teacher on the rows it was fitted to; the error
+    # against the fares on the test split is reported by evaluate.py.
+    student_predictions = student.predict(X)
+    fidelity = RegressionMetrics().update(soft_labels, student_predictions).result()
+    # The serving container predicts a forest with the flat-array engine.
+    serving_student = ForestEngine.from_model(student) if isinstance(student, RandomForestRegressor) else student
+    report = {
+        "student_type": args.student_type,
+        "n_estimators": args.student_n_estimators,
+        "max_depth": args.student_max_depth,
+        "rows": len(X),
+        "fit_seconds": fit_seconds,
+        "fidelity": fidelity,
+        "teacher_predict_ms_per_1000_rows": predict_ms(teacher, X),
+        "student_predict_ms_per_1000_rows": predict_ms(serving_student, X),
+    }
+    logging.info(f"Distillation done: {report}")
+
+    save_student(student, args.output_dir, student_predictions)
+    with open(os.path.join(args.output_dir, REPORT_NAME), "w") as f:
+        json.dump(report, f, indent=1)
+
+
+if __name__ == "__main__":
+    logging.info("Parsing args")
+    args = parse_args()
+    main()
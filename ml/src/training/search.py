@@ -0,0 +1,106 @@
+import os
+import math
+import time
+import json
+import logging
+import itertools
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+# Read-only training data of each worker process, memory-mapped by init_worker.
+_data = None
+
+
+def parse_max_features(value):
+    """"sqrt"/"log2", an int number of features, or a float fraction of them."""
+    if value in ("sqrt", "log2"):
+        return value
+    return float(value) if "." in value else int(value)
+
+
+def candidate_grid(grid):
+    """All combinations of a {parameter: [values]} grid, as a list of parameter dicts."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def halving_schedule(n_candidates, n_rows, factor, min_rows):
+    """Training rows per round: the last round uses all rows, each earlier one a factor fewer.
+
+    There are just enough rounds to halve down to one candidate, but none
+    that would train on fewer than min_rows rows.
+    """
+    halvings = math.ceil(math.log(n_candidates, factor)) if n_candidates > 1 else 0
+    if n_rows > min_rows:
+        halvings = min(halvings, int(math.log(n_rows / min_rows, factor)))
+    else:
+        halvings = 0
+    return [n_rows // factor ** (halvings - r) for r in range(halvings + 1)]
+
+
+def init_worker(data_dir):
+    global _data
+    _data = {name: np.load(os.path.join(data_dir, f"{name}.npy"), mmap_mode="r")
+             for name in ("X_train", "y_train", "X_val", "y_val")}
+
+
+def fit_candidate(params, rows, random_state):
+    """Fit one forest on the first `rows` (already shuffled) training rows and score it on the validation rows."""
+    model = RandomForestRegressor(random_state=random_state, n_jobs=1, **params)
+    start = time.perf_counter()
+    model.fit(_data["X_train"][:rows], _data["y_train"][:rows])
+    fit_seconds = time.perf_counter() - start
+    error = model.predict(_data["X_val"]) - _data["y_val"]
+    return {"fit_seconds": fit_seconds, "validation_rmse": float(np.sqrt(np.mean(error * error)))}
+
+
+def successive_halving(X: np.ndarray, y: np.ndarray, grid, factor=3, min_rows=100_000,
+                       validation_fraction=0.2, n_workers=None, random_state=None):
+    """Search a forest grid with successive halving over training rows.
+
+    Rows are shuffled once and split into train and validation parts, which
+    are written as .npy files and memory-mapped read-only by every worker.
+    Each round fits all remaining candidates on a growing prefix of the
+    training part, in parallel, and keeps the best 1/factor by validation
+    RMSE. Returns the best parameters and a leaderboard row per fit.
+    """
+    candidates = candidate_grid(grid)
+    order = np.random.default_rng(random_state).permutation(len(X))
+    n_val = max(1, int(len(X) * validation_fraction))
+    schedule = halving_schedule(len(candidates), len(X) - n_val, factor, min_rows)
+    logging.info(f"Successive halving over {len(candidates)} candidates with rows per round {schedule}")
+
+    leaderboard = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        np.save(os.path.join(data_dir, "X_train.npy"), np.ascontiguousarray(X[order[n_val:]], dtype=np.float32))
+        np.save(os.path.join(data_dir, "y_train.npy"), np.asarray(y[order[n_val:]], dtype=np.float64))
+        np.save(os.path.join(data_dir, "X_val.npy"), np.ascontiguousarray(X[order[:n_val]], dtype=np.float32))
+        np.save(os.path.join(data_dir, "y_val.npy"), np.asarray(y[order[:n_val]], dtype=np.float64))
+
+        n_workers = n_workers or os.cpu_count()
+        with ProcessPoolExecutor(n_workers, initializer=init_worker, initargs=(data_dir,)) as pool:
+            survivors = list(range(len(candidates)))
+            for round_number, rows in enumerate(schedule):
+                futures = [pool.submit(fit_candidate, candidates[i], rows, random_state) for i in survivors]
+                scores = {}
+                for i, future in zip(survivors, futures):
+                    result = future.result()
+                    scores[i] = result["validation_rmse"]
+                    leaderboard.append({"candidate": i, "round": round_number, "rows": rows,
+                                        **candidates[i], **result})
+                survivors = sorted(survivors, key=scores.get)
+                logging.info(f"Round {round_number} ({rows} rows): best validation RMSE "
+                             f"{scores[survivors[0]]:.4f} with {candidates[survivors[0]]}")
+                if round_number < len(schedule) - 1:
+                    survivors = survivors[:max(1, math.ceil(len(survivors) / factor))]
+
+    leaderboard.sort(key=lambda row: (-row["round"], row["validation_rmse"]))
+    return candidates[survivors[0]], leaderboard
+
+
+def write_leaderboard(leaderboard, path):
+    with open(path, "w") as f:
+        json.dump(leaderboard, f, indent=1)
+    logging.info(f"Leaderboard with {len(leaderboard)} fits written to {path}")
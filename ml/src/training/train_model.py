@@ -1,16 +1,43 @@
 import os
+import sys
+import math
+import time
+import resource
+import shutil
 import argparse
 import joblib
+import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OrdinalEncoder
 import logging
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.dataset_io import FORMATS, dataset_num_rows, iter_dataset_batches, read_dataset
+from common.data_profile import PROFILE_NAME, write_model_profile
+from common.forest_arrays import forest_to_arrays, save_forest_arrays
+from common.zone_features import FOLDS_DIR, ZONE_FEATURES_DIR, load_out_of_fold_zone_features, load_zone_features
+from search import parse_max_features, successive_halving, write_leaderboard
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
     datefmt="%Y-%m-%d %H:%M:%S"
 )
 
+MODEL_TYPES = ("forest", "hist_gbm")
+
+# Encoded as native categoricals by the hist_gbm model
+CATEGORICAL_FEATURES = ["PULocationID", "DOLocationID", "payment_type"]
+
+# HistGradientBoostingRegressor takes at most max_bins (255) categories per
+# feature; rarer zones share the missing-value category.
+MAX_CATEGORIES = 255
+
+args = None
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -18,63 +45,267 @@ def parse_args():
     parser.add_argument("--n_estimators", type=int, default=200)
     parser.add_argument("--max_depth", type=int, default=10)
     parser.add_argument("--random_state", type=int, default=58)
+    parser.add_argument("--model_type", choices=MODEL_TYPES, default="forest")
+    parser.add_argument("--learning_rate", type=float, default=0.1,
+                        help="hist_gbm only; n_estimators is its number of boosting iterations")
+    parser.add_argument("--training_mode", choices=["full", "incremental", "search"], default="full",
+                        help="incremental grows the forest batch by batch instead of loading all rows; "
+                             "search picks the forest's hyperparameters by successive halving first")
+    parser.add_argument("--batch_rows", type=int, default=1_000_000,
+                        help="Rows per batch in incremental mode")
+    parser.add_argument("--search_n_estimators", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--search_max_depth", type=int, nargs="+", default=[8, 10, 14])
+    parser.add_argument("--search_min_samples_leaf", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--search_max_features", type=parse_max_features, nargs="+", default=[1.0, 0.6],
+                        help="sqrt, log2, a number of features or a fraction of them")
+    parser.add_argument("--search_factor", type=int, default=3,
+                        help="Each search round keeps 1/factor of the candidates on factor times the rows")
+    parser.add_argument("--search_min_rows", type=int, default=100_000,
+                        help="Fewest training rows of a search round")
+    parser.add_argument("--search_validation_fraction", type=float, default=0.2)
+    parser.add_argument("--search_n_workers", type=int, default=None,
+                        help="Candidates fitted in parallel; one single-threaded fit per CPU by default")
+    parser.add_argument("--leaderboard_name", default="leaderboard.json",
+                        help="File in the model dir listing every search fit")
     parser.add_argument("--train_file_name", required=True)
+    parser.add_argument("--data_format", choices=FORMATS, default=None,
+                        help="Format of the training file; inferred from its extension by default")
     parser.add_argument("--target", required=True)
-    parser.add_argument("--model_save_name", default="model.pkl")
+    parser.add_argument("--model_save_name", default="model.pkl",
+                        help="Pickle of a model without flat arrays; forests are saved as arrays only")
+    parser.add_argument("--zone_features_dir", default=ZONE_FEATURES_DIR,
+                        help="Zone feature store in the train channel, appended to the features and saved with "
+                             "the model when present; empty to train on the raw features only")
+    parser.add_argument("--forest_arrays_dir", default="forest",
+                        help="Subdirectory of the model dir for the forest's flat tree arrays")
+    parser.add_argument("--profile_prediction_rows", type=int, default=1_000_000,
+                        help="Training rows predicted to profile the model's predictions; 0 uses all of them")
     parser.add_argument("--is_local", type=bool, default=False)
     
     return parser.parse_args()
 
-logging.info("Parsing args")
-args = parse_args()
+def training_file_path():
+    return os.path.join(os.environ["SM_CHANNEL_TRAIN"], args.train_file_name)
 
-if args.is_local:
-    from dotenv import load_dotenv 
-    logging.info("Adding auth keys")
-    load_dotenv()
-    os.environ["AWS_ACCESS_KEY_ID"] = os.getenv("Access_key_id")
-    os.environ["AWS_SECRET_ACCESS_KEY"] = os.getenv("Secret_access_key")
+def zone_features_path():
+    if not args.zone_features_dir:
+        return None
+    path = os.path.join(os.environ["SM_CHANNEL_TRAIN"], args.zone_features_dir)
+    return path if os.path.isdir(path) else None
 
-def load_data():
+def load_zone_features_store():
+    path = zone_features_path()
+    if path is None:
+        logging.info("No zone feature store; training on the raw features")
+        return None
+    logging.info(f"Appending zone features from {path}")
+    return load_zone_features(path)
+
+def load_training_zone_features(zone_features):
+    """The out-of-fold store for the training rows when preprocessing wrote one, else the full store."""
+    path = zone_features_path()
+    out_of_fold = None if path is None else load_out_of_fold_zone_features(path)
+    if out_of_fold is None:
+        return zone_features
+    logging.info(f"Training rows get out-of-fold zone features from {len(out_of_fold.folds)} folds")
+    return out_of_fold
+
+def load_data(zone_features=None):
     logging.info("Loading data...")
-    training_path = os.environ["SM_CHANNEL_TRAIN"]
-    train_df = pd.read_csv(
-        os.path.join(training_path, args.train_file_name)
-    )
+    train_df = read_dataset(training_file_path(), args.data_format, memory_map=True)
+    if zone_features is not None:
+        train_df = zone_features.apply(train_df)
     return train_df
 
  
+def build_model(model_type, X: pd.DataFrame, n_estimators, max_depth, random_state, learning_rate=0.1,
+                min_samples_leaf=1, max_features=1.0):
+    """Unfitted model of model_type; X is only used to pick hist_gbm's categories."""
+    if model_type == "forest":
+        return RandomForestRegressor(
+        n_estimators=n_estimators,
+        max_depth=max_depth,
+        min_samples_leaf=min_samples_leaf,
+        max_features=max_features,
+        random_state=random_state,
+        n_jobs=-1
+        )
+
+    # Most frequent codes first; anything else, including codes unseen in
+    # training, is encoded as NaN, which the booster treats as its own category.
+    categories = [
+        np.sort(X[feature].value_counts().index[:MAX_CATEGORIES].to_numpy())
+        for feature in CATEGORICAL_FEATURES
+    ]
+    encoder = ColumnTransformer(
+        [("categories", OrdinalEncoder(categories=categories, handle_unknown="use_encoded_value",
+                                       unknown_value=np.nan), CATEGORICAL_FEATURES)],
+        remainder="passthrough",
+    )
+    return Pipeline([
+        ("encode", encoder),
+        ("model", HistGradientBoostingRegressor(
+            max_iter=n_estimators,
+            max_depth=max_depth,
+            learning_rate=learning_rate,
+            # the encoder puts the categorical features first
+            categorical_features=list(range(len(CATEGORICAL_FEATURES))),
+            random_state=random_state,
+        )),
+    ])
+
+
 def train_model(train_df:pd.DataFrame):
     logging.info("Splitting for inde & target data...")
     X=train_df.drop(args.target, axis=1)
     y = train_df[args.target]
-    
+
+    model = build_model(args.model_type, X, args.n_estimators, args.max_depth,
+                        args.random_state, args.learning_rate)
+
+    logging.info(f"Training {args.model_type}...")
+    model.fit(X, y)
+    return model
+
+
+def train_model_search(train_df:pd.DataFrame):
+    """Pick the forest's hyperparameters by successive halving, then refit the winner on all rows."""
+    X = train_df.drop(args.target, axis=1)
+    y = train_df[args.target]
+    grid = {
+        "n_estimators": args.search_n_estimators,
+        "max_depth": args.search_max_depth,
+        "min_samples_leaf": args.search_min_samples_leaf,
+        "max_features": args.search_max_features,
+    }
+    best_params, leaderboard = successive_halving(
+        X.to_numpy(dtype=np.float32), y.to_numpy(), grid,
+        factor=args.search_factor,
+        min_rows=args.search_min_rows,
+        validation_fraction=args.search_validation_fraction,
+        n_workers=args.search_n_workers,
+        random_state=args.random_state,
+    )
+    write_leaderboard(leaderboard, os.path.join(os.environ["SM_MODEL_DIR"], args.leaderboard_name))
+    best_rmse = min(row["validation_rmse"] for row in leaderboard if row["round"] == leaderboard[0]["round"])
+    logging.info(f"Search picked {best_params} search_best_rmse={best_rmse:.4f}")
+
+    model = build_model("forest", X, random_state=args.random_state, **best_params)
+    logging.info("Training the picked forest on all rows...")
+    model.fit(X, y)
+    return model
+
+
+def train_model_incremental(zone_features=None):
+    """Grow the forest over the training file one batch at a time.
+
+    The n_estimators trees are spread over the batches in proportion to
+    their rows, so a short last batch gets few or no trees; each batch adds
+    its share of trees with warm_start, fitted on that batch only, so at
+    most batch_rows rows are in memory at once.
+    """
+    train_path = training_file_path()
+    total_rows = dataset_num_rows(train_path, args.data_format)
+    n_batches = max(1, math.ceil(total_rows / args.batch_rows))
+    if n_batches > args.n_estimators:
+        logging.warning(f"{n_batches} batches but only {args.n_estimators} trees; "
+                        f"increase batch_rows or some batches will not be used")
+
     model = RandomForestRegressor(
-    n_estimators=args.n_estimators,
+    n_estimators=0,
     max_depth=args.max_depth,
     random_state=args.random_state,
+    warm_start=True,
     n_jobs=-1
     )
 
-    logging.info("Training...")
-    model.fit(X, y)
-    return model
+    rows = 0
+    rows_read = 0
+    for batch_number, batch in enumerate(iter_dataset_batches(train_path, args.batch_rows, args.data_format)):
+        # Trees up to the end of this batch minus trees up to its start, both by share of rows
+        n_trees = (round(args.n_estimators * (rows_read + len(batch)) / total_rows)
+                   - round(args.n_estimators * rows_read / total_rows))
+        rows_read += len(batch)
+        if n_trees == 0:
+            continue
+        model.n_estimators += n_trees
+        logging.info(f"Training {n_trees} trees on batch {batch_number} ({len(batch)} rows)...")
+        if zone_features is not None:
+            batch = zone_features.apply(batch)
+        model.fit(batch.drop(args.target, axis=1), batch[args.target])
+        rows += len(batch)
+    return model, rows
 
  
-def save_models(model: RandomForestRegressor):
+def training_predictions(model, zone_features=None):
+    """The model's predictions on a random sample of profile_prediction_rows training rows."""
+    train_df = read_dataset(training_file_path(), args.data_format, memory_map=True)
+    if args.profile_prediction_rows and args.profile_prediction_rows < len(train_df):
+        positions = np.sort(np.random.default_rng(args.random_state)
+                            .choice(len(train_df), args.profile_prediction_rows, replace=False))
+        train_df = train_df.iloc[positions]
+    X = train_df.drop(columns=args.target)
+    return model.predict(X if zone_features is None else zone_features.apply(X))
+
+
+def save_models(model, zone_features=None):
     logging.info("Saving models...")
     model_dir = os.environ["SM_MODEL_DIR"]
     # if args.is_local:
     #     model_dir = 
-    logging.info(f"Model save path {os.path.join(model_dir, args.model_save_name)}")
-    joblib.dump(model, os.path.join(model_dir, args.model_save_name))
+    if isinstance(model, RandomForestRegressor):
+        # Serving, evaluation and distillation predict a forest from its flat arrays, which reproduce
+        # its predictions exactly, so the several times larger pickle is not shipped.
+        logging.info(f"Model save path {os.path.join(model_dir, args.forest_arrays_dir)}")
+        save_forest_arrays(forest_to_arrays(model), os.path.join(model_dir, args.forest_arrays_dir))
+    else:
+        logging.info(f"Model save path {os.path.join(model_dir, args.model_save_name)}")
+        joblib.dump(model, os.path.join(model_dir, args.model_save_name))
+    if zone_features_path() is not None:
+        # The model's last features come from this store, so it ships with the model.
+        # The out-of-fold stores are only for training.
+        shutil.copytree(zone_features_path(), os.path.join(model_dir, ZONE_FEATURES_DIR), dirs_exist_ok=True,
+                        ignore=shutil.ignore_patterns(FOLDS_DIR))
+    profile_path = os.path.join(os.environ["SM_CHANNEL_TRAIN"], PROFILE_NAME)
+    if os.path.exists(profile_path):
+        # Serving compares live requests with the training split's profile and
+        # its predictions with the model's own predictions on training rows.
+        write_model_profile(profile_path, training_predictions(model, zone_features),
+                            os.path.join(model_dir, PROFILE_NAME))
     logging.info("Model saving is done!")
 
 def main():
-    train_df = load_data()
-    model = train_model(train_df)        
-    logging.info(f"Training is done!")
-    save_models(model)
+    if args.training_mode in ("incremental", "search") and args.model_type != "forest":
+        raise ValueError(f"{args.training_mode} training is only supported for model_type forest")
+    start = time.perf_counter()
+    zone_features = load_zone_features_store()
+    training_zone_features = load_training_zone_features(zone_features)
+    if args.training_mode == "incremental":
+        model, rows = train_model_incremental(training_zone_features)
+    elif args.training_mode == "search":
+        train_df = load_data(training_zone_features)
+        rows = len(train_df)
+        model = train_model_search(train_df)
+    else:
+        train_df = load_data(training_zone_features)
+        rows = len(train_df)
+        model = train_model(train_df)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    logging.info(f"Training is done! rows={rows} seconds={seconds:.2f} "
+                 f"rows_per_second={rows / seconds:.1f} peak_rss_mb={peak_rss_mb:.1f}")
+    save_models(model, zone_features)
  
 if __name__ == "__main__":
+    logging.info("Parsing args")
+    args = parse_args()
+
+    if args.is_local:
+        from dotenv import load_dotenv 
+        logging.info("Adding auth keys")
+        load_dotenv()
+        os.environ["AWS_ACCESS_KEY_ID"] = os.getenv("Access_key_id")
+        os.environ["AWS_SECRET_ACCESS_KEY"] = os.getenv("Secret_access_key")
+
     main()
\ No newline at end of file